@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodordering.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up by get_asgi_application
+from django.conf import settings  # noqa: E402
+from service_api.events import order_events_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Order event streams are long lived, so they are served by a native
+    # ASGI application instead of Django's request handler.
+    if scope["type"] == "http" and scope["path"] == settings.EVENTS_PATH:
+        await order_events_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
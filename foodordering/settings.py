@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,11 +44,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'service_api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'service_api.routers.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,11 +79,73 @@ WSGI_APPLICATION = 'foodordering.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'django.db.backends.sqlite3')
+
+# Seconds a connection is kept open and reused by later requests, 0 closes
+# it at the end of every request. For pooling in front of PostgreSQL, point
+# DATABASE_HOST at pgbouncer and set DATABASE_DISABLE_SERVER_SIDE_CURSORS
+# to 1 or true when it runs in transaction pooling mode.
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))
+
+if DATABASE_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Seconds a write waits for the lock held by another writer
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+            },
+            'TEST': {
+                # A file rather than the in-memory default, so tests see
+                # the same WAL locking as concurrent workers do
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': os.environ['DATABASE_NAME'],
+            'USER': os.environ.get('DATABASE_USER', ''),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', ''),
+            'PORT': os.environ.get('DATABASE_PORT', ''),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get(
+                'DATABASE_DISABLE_SERVER_SIDE_CURSORS', ''
+            ).lower() in ('1', 'true', 'yes', 'on'),
+        }
     }
+
+# Read replicas, comma separated SQLite files or database server hosts. They
+# become the aliases replica0, replica1, ... and serve order history and
+# the restaurant catalogue; during tests they mirror the default database.
+_replica_key = 'NAME' if DATABASE_ENGINE == 'django.db.backends.sqlite3' else 'HOST'
+_replicas = [name for name in os.environ.get('DATABASE_REPLICAS', '').split(',') if name]
+for index, location in enumerate(_replicas):
+    DATABASES['replica{}'.format(index)] = dict(
+        DATABASES['default'], TEST={'MIRROR': 'default'}, **{_replica_key: location}
+    )
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['service_api.routers.ReplicaRouter']
+
+# Seconds reads stay on the primary after a user's write or a catalogue
+# change, longer than the replication lag
+REPLICA_PIN_SECONDS = 5
+
+# Pragmas run on every new SQLite connection. WAL lets readers run next to
+# a writer, synchronous=NORMAL is durable across crashes of the process in
+# WAL mode and busy_timeout is in milliseconds.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)) * 1000,
+    'mmap_size': 256 * 1024 * 1024,
 }
 
 
@@ -103,6 +168,29 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+PASSWORD_HASHERS = [
+    'service_api.passwords.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# PBKDF2 iterations of new hashes, stored hashes with another count are
+# rehashed on the next successful login
+PASSWORD_HASH_ITERATIONS = 216000
+
+# Threads hashing and checking passwords, which bounds the CPU logins and
+# sign ups can take away from the rest of the API
+PASSWORD_HASHING_WORKERS = 2
+
+# Password checks waiting for a hashing thread before new ones are refused
+PASSWORD_HASHING_BACKLOG = 16
+
+# Logins of the browsable API and the admin check passwords in the hashing
+# pool as well
+AUTHENTICATION_BACKENDS = ['service_api.passwords.PooledPasswordBackend']
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.1/topics/i18n/
 
@@ -121,3 +209,122 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'service_api.authentication.BearerTokenAuthentication',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'service_api.pagination.IdCursorPagination',
+    'PAGE_SIZE': 50,
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_username': '10/min',
+        'register': '20/hour',
+    },
+}
+
+# Upper bound for the page_size query parameter of list endpoints
+API_MAX_PAGE_SIZE = 200
+
+# Upper bound for the number of items of a bulk request
+BULK_MAX_ITEMS = 100
+
+# Upper bound for the quantity of one food in an order
+ORDER_MAX_QUANTITY = 1000
+
+# Longest delivery time in minutes a manager can set when accepting an order
+ORDER_MAX_TIME_TO_DELIVER = 24 * 60
+
+# Longest period in days the manager statistics endpoint returns at once
+STATS_MAX_DAYS = 366
+
+# Orders fetched from the database at a time by the streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Days after delivery or cancellation an order is moved to the archive
+# tables by the archive_orders command
+ARCHIVE_AFTER_DAYS = 90
+
+# Orders moved to the archive in one transaction
+ARCHIVE_BATCH_SIZE = 1000
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+# Throttles, replica pins and token revocations rely on the default cache,
+# point it at a shared backend such as memcached when running several
+# worker processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds a cached restaurant catalogue page is kept, the catalogue version
+# already invalidates it on every restaurant change
+CATALOGUE_CACHE_TIMEOUT = 60 * 60
+
+# Seconds a cached restaurant menu is kept, food changes already delete it
+MENU_CACHE_TIMEOUT = 60 * 60
+
+
+# Order events streamed to clients over the ASGI application
+
+EVENTS_PATH = '/api/v1/events/'
+
+# Dotted path of the publish/subscribe hub class delivering order events
+EVENTS_HUB = 'service_api.events.LocalEventHub'
+
+# Events buffered per connection before a slow client starts losing them
+EVENTS_QUEUE_SIZE = 100
+
+# Seconds of silence after which a keepalive comment is sent
+EVENTS_KEEPALIVE = 15
+
+# Dotted paths of background tasks enqueued for each order event, e.g.
+# {'order.delivered': ['myapp.tasks.send_receipt']}, every task is called
+# with the order_id and event keyword arguments by the run_tasks worker
+ORDER_EVENT_TASKS = {}
+
+
+# Seconds of upcoming delivery deadlines the watch_deadlines scheduler
+# keeps in memory, and how often it looks for newly accepted orders
+DEADLINE_HORIZON = 15 * 60
+DEADLINE_REFRESH = 30
+
+
+# Background task queue run by the run_tasks command
+
+# Threads, or processes with --processes, running tasks in one worker
+TASK_WORKERS = 4
+
+# Seconds an idle worker waits before looking for due tasks again
+TASK_POLL_INTERVAL = 1
+
+# Runs of a task before it is marked as failed, retries wait
+# TASK_RETRY_DELAY seconds, doubled after every failed run
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 10
+
+# Seconds after which a task still running is assumed to belong to a dead
+# worker and is run again
+TASK_LEASE_SECONDS = 5 * 60
+
+
+# Seconds a bearer token issued by the login endpoint stays valid, role
+# changes of a user only reach the token claims after logging in again.
+# Tokens revoked by logging out are kept in the default cache, which like
+# the throttles and replica pins has to be shared by every worker process
+AUTH_TOKEN_TTL = 60 * 60
+
+
+# Requests slower than this many seconds or running more queries than this
+# are logged as warnings by the metrics middleware, None disables a check
+METRICS_LATENCY_BUDGET = 0.5
+METRICS_QUERY_BUDGET = 20
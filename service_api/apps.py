@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ServiceApiConfig(AppConfig):
     name = 'service_api'
     verbose_name = 'Service API'
+
+    def ready(self):
+        from service_api import signals  # noqa: F401
@@ -0,0 +1,118 @@
+import heapq
+import itertools
+
+from django.db import transaction
+from django.db.models.functions import Coalesce
+
+from service_api.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+
+# Columns copied from the live tables into the archive ones
+ORDER_FIELDS = tuple(field.attname for field in ArchivedOrder._meta.concrete_fields)
+ITEM_FIELDS = ("order_id", "food_id", "quantity", "unit_price")
+
+
+class OrderHistory:
+    """
+    Live and archived orders read as one queryset, for the history lists.
+
+    Supports what cursor pagination needs: filter(), order_by() and slices
+    with a stop, which read the slice from every store and merge the rows.
+    """
+
+    def __init__(self, *querysets, ordering=()):
+        self.querysets = querysets
+        self.ordering = ordering
+
+    @classmethod
+    def filter_orders(cls, *args, **kwargs):
+        return cls(
+            Order.objects.filter(*args, **kwargs),
+            ArchivedOrder.objects.filter(*args, **kwargs),
+        )
+
+    def _apply(self, method, *args, **kwargs):
+        querysets = (
+            getattr(queryset, method)(*args, **kwargs) for queryset in self.querysets
+        )
+        return OrderHistory(
+            *querysets, ordering=args if method == "order_by" else self.ordering
+        )
+
+    def filter(self, *args, **kwargs):
+        return self._apply("filter", *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._apply("order_by", *fields)
+
+    def prefetch_related(self, *lookups):
+        return self._apply("prefetch_related", *lookups)
+
+    def using(self, alias):
+        return self._apply("using", alias)
+
+    def _key(self, order):
+        return tuple(getattr(order, field.lstrip("-")) for field in self.ordering)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.stop is None or key.step is not None:
+            raise TypeError("Order history only supports slices with a stop.")
+        if not self.ordering:
+            raise TypeError("Order history must be ordered before slicing.")
+        # Every store is ordered the same way, so the first stop rows of the
+        # merge are among the first stop rows of each store.
+        merged = heapq.merge(
+            *(queryset[: key.stop] for queryset in self.querysets),
+            key=self._key,
+            reverse=self.ordering[0].startswith("-"),
+        )
+        return list(itertools.islice(merged, key.start, key.stop))
+
+
+def finished_before(cutoff):
+    """
+    Return the live orders delivered or cancelled before cutoff, or placed
+    before it when they were finished before transition times were stored.
+    """
+    return Order.objects.annotate(
+        finished=Coalesce("delivered_datetime", "cancell_datetime", "create_datetime")
+    ).filter(status__in=Order.FINISHED_STATUSES, finished__lt=cutoff)
+
+
+def archive_batch(order_ids):
+    """
+    Move the orders of order_ids and their items to the archive tables in
+    one transaction, and return the number of orders moved.
+    """
+    with transaction.atomic():
+        orders = Order.objects.filter(
+            pk__in=order_ids, status__in=Order.FINISHED_STATUSES
+        )
+        rows = list(orders.values(*ORDER_FIELDS))
+        ids = [row["id"] for row in rows]
+        items = OrderItem.objects.filter(order_id__in=ids)
+        ArchivedOrder.objects.bulk_create(ArchivedOrder(**row) for row in rows)
+        ArchivedOrderItem.objects.bulk_create(
+            ArchivedOrderItem(**row) for row in items.values(*ITEM_FIELDS)
+        )
+        items.delete()
+        Order.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def archive_orders(cutoff, batch_size):
+    """
+    Archive every order finished before cutoff, batch_size orders per
+    transaction, and return the number of orders moved.
+    """
+    candidates = finished_before(cutoff).order_by("pk")
+    moved = 0
+    last_id = 0
+    while True:
+        batch = list(
+            candidates.filter(pk__gt=last_id).values_list("pk", flat=True)[:batch_size]
+        )
+        if not batch:
+            return moved
+        moved += archive_batch(batch)
+        last_id = batch[-1]
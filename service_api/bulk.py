@@ -0,0 +1,121 @@
+from django.db import connection, transaction
+
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+from service_api.events import ORDER_CREATED, publish_order_event
+from service_api.models import Order, OrderItem
+from service_api.serializers import (
+    BulkOrderItemSerializer,
+    count_quantities,
+    load_foods,
+    price_order,
+)
+from service_api.stats import record_placed
+from service_api.transitions import transition_orders
+
+
+def place_orders(customer, items):
+    """
+    Place a list of orders for customer and return one result per item.
+
+    Items are validated on their own, then all of their foods are loaded
+    with one query to price them. Valid orders and their items are
+    inserted in bulk inside one transaction, invalid ones are reported
+    with errors.
+    """
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        serializer = BulkOrderItemSerializer(data=item)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            quantities = count_quantities(data["foods"], data["items"])
+            valid.append((index, data["note"], quantities))
+        else:
+            results[index] = _result(
+                index, status.HTTP_400_BAD_REQUEST, serializer.errors
+            )
+
+    foods = load_foods(
+        {food_id for _, _, quantities in valid for food_id in quantities}
+    )
+
+    orders = []
+    for index, note, quantities in valid:
+        try:
+            restaurant_id, order_items, total = price_order(quantities, foods)
+        except ValidationError as exc:
+            results[index] = _result(index, status.HTTP_400_BAD_REQUEST, exc.detail)
+            continue
+        order = Order(
+            customer_id=customer.pk, restaurant_id=restaurant_id, total=total, note=note
+        )
+        orders.append((index, order, order_items))
+
+    with transaction.atomic():
+        new_orders = [order for _, order, _ in orders]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Order.objects.bulk_create(new_orders)
+        else:
+            # Without RETURNING the primary keys of bulk inserted rows are
+            # unknown, and they are needed for the order items.
+            for order in new_orders:
+                order.save(force_insert=True)
+        for _, order, order_items in orders:
+            for order_item in order_items:
+                order_item.order = order
+        OrderItem.objects.bulk_create(
+            order_item for _, _, order_items in orders for order_item in order_items
+        )
+        record_placed(new_orders)
+        for order in new_orders:
+            publish_order_event(order, ORDER_CREATED)
+
+    for index, order, _ in orders:
+        results[index] = _result(
+            index, status.HTTP_201_CREATED, id=order.pk, total=order.total
+        )
+    return results
+
+
+def accept_orders(manager, order_ids, **fields):
+    """
+    Accept a list of the manager's orders with one conditional UPDATE and
+    return one result per order id.
+    """
+    queryset = Order.objects.filter(
+        pk__in=order_ids, restaurant__manager=manager.pk
+    )
+    with transaction.atomic():
+        accepted = transition_orders(queryset, Order.ACCEPTED, **fields)
+        owned = set(queryset.values_list("pk", flat=True))
+
+    results = []
+    for index, pk in enumerate(order_ids):
+        if pk in accepted:
+            results.append(_result(index, status.HTTP_200_OK, id=pk))
+        elif pk in owned:
+            results.append(
+                _result(
+                    index,
+                    status.HTTP_409_CONFLICT,
+                    "Only pending orders can be accepted.",
+                    id=pk,
+                )
+            )
+        else:
+            results.append(
+                _result(index, status.HTTP_404_NOT_FOUND, "Order not found.", id=pk)
+            )
+        # A repeated id was only accepted once.
+        accepted.discard(pk)
+    return results
+
+
+def _result(index, status_code, errors=None, **extra):
+    result = {"index": index, "status": status_code}
+    result.update(extra)
+    if errors is not None:
+        result["errors"] = errors
+    return result
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+CATALOGUE_VERSION_KEY = "catalogue:version"
+CATALOGUE_CHANGED_KEY = "catalogue:changed"
+
+
+def _new_version():
+    # Start from the current time, so a version key evicted from the cache
+    # never comes back with a number that was already used.
+    return int(time.time() * 1000)
+
+
+def get_catalogue_version():
+    """
+    Return the current version of the restaurant catalogue.
+    """
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOGUE_VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(CATALOGUE_VERSION_KEY)
+    return version
+
+
+def bump_catalogue_version():
+    """
+    Invalidate every cached page of the restaurant catalogue and return
+    the new version.
+    """
+    cache.set(CATALOGUE_CHANGED_KEY, True, timeout=settings.REPLICA_PIN_SECONDS)
+    try:
+        return cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        version = _new_version()
+        cache.set(CATALOGUE_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def catalogue_recently_changed():
+    """
+    Return whether the catalogue changed too recently for replicas to have
+    caught up.
+    """
+    return bool(cache.get(CATALOGUE_CHANGED_KEY))
+
+
+def make_key(prefix, version, *parts):
+    digest = hashlib.md5("\n".join(str(part) for part in parts).encode()).hexdigest()
+    return "{}:{}:{}".format(prefix, version, digest)
+
+
+def make_etag(data):
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+    return '"{}"'.format(hashlib.sha1(content.encode()).hexdigest())
+
+
+def get_or_set_catalogue(request, build):
+    """
+    Return (etag, data) of the catalogue page for the request.
+
+    build is called to produce the data on a cache miss, and the result
+    is kept until the catalogue version changes.
+    """
+    key = make_key(
+        "catalogue",
+        get_catalogue_version(),
+        request.accepted_renderer.format,
+        request.build_absolute_uri(),
+    )
+    entry = cache.get(key)
+    if entry is None:
+        data = build()
+        entry = (make_etag(data), data)
+        cache.set(key, entry, timeout=settings.CATALOGUE_CACHE_TIMEOUT)
+    return entry
+
+
+def menu_key(restaurant_id):
+    return "menu:{}".format(restaurant_id)
+
+
+def get_or_set_menu(restaurant_id, build):
+    """
+    Return the serialized foods of a restaurant, calling build on a miss.
+    """
+    key = menu_key(restaurant_id)
+    menu = cache.get(key)
+    if menu is None:
+        menu = build()
+        cache.set(key, menu, timeout=settings.MENU_CACHE_TIMEOUT)
+    return menu
+
+
+def invalidate_menu(restaurant_id):
+    cache.delete(menu_key(restaurant_id))
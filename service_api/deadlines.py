@@ -0,0 +1,88 @@
+import datetime
+import heapq
+
+from django.db import transaction
+
+from service_api.events import ORDER_OVERDUE, publish_order_event
+from service_api.models import Order
+
+
+def unflagged_orders():
+    """
+    Return the accepted orders not flagged as overdue yet, which the
+    order_unflagged_due_idx partial index covers.
+    """
+    return Order.objects.filter(status=Order.ACCEPTED, overdue_datetime__isnull=True)
+
+
+def flag_overdue(order_ids, now):
+    """
+    Flag the orders of order_ids still accepted and past their deadline at
+    now as overdue, publish an event for each and return them.
+    """
+    with transaction.atomic():
+        # The rows are locked, so the ones read are exactly the ones flagged.
+        flagged = list(
+            unflagged_orders()
+            .select_for_update()
+            .filter(pk__in=order_ids, due_datetime__lte=now)
+            .only("id", "customer_id", "restaurant_id", "status")
+        )
+        Order.objects.filter(pk__in=[order.pk for order in flagged]).update(
+            overdue_datetime=now
+        )
+        for order in flagged:
+            order.overdue_datetime = now
+            publish_order_event(order, ORDER_OVERDUE)
+    return flagged
+
+
+class DeadlineScheduler:
+    """
+    Min-heap of the delivery deadlines of accepted orders due within the
+    next horizon seconds.
+
+    The heap is filled with a range query on the deadline index every
+    refresh seconds, in between the scheduler only wakes up when the
+    earliest deadline passes.
+    """
+
+    def __init__(self, horizon, refresh):
+        self.horizon = datetime.timedelta(seconds=horizon)
+        self.refresh = datetime.timedelta(seconds=refresh)
+        self.heap = []
+        self.scheduled = set()
+        self.next_refresh = None
+
+    def load(self, now):
+        """
+        Push the deadlines up to now + horizon which are not in the heap yet.
+        """
+        deadlines = unflagged_orders().filter(due_datetime__lte=now + self.horizon)
+        for pk, due in deadlines.values_list("pk", "due_datetime"):
+            if pk not in self.scheduled:
+                heapq.heappush(self.heap, (due, pk))
+                self.scheduled.add(pk)
+        self.next_refresh = now + self.refresh
+
+    def run_pending(self, now):
+        """
+        Flag the orders whose deadline passed and return them, reloading
+        the heap first when it is time to.
+        """
+        if self.next_refresh is None or now >= self.next_refresh:
+            self.load(now)
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, pk = heapq.heappop(self.heap)
+            self.scheduled.discard(pk)
+            due.append(pk)
+        return flag_overdue(due, now) if due else []
+
+    def wake_up_at(self):
+        """
+        Return when run_pending should be called next.
+        """
+        if self.heap:
+            return min(self.heap[0][0], self.next_refresh)
+        return self.next_refresh
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import threading
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+
+from service_api.authentication import TOKEN_KEYWORD, read_token
+from service_api.models import Restaurant
+from service_api.tasks import enqueue
+
+
+ORDER_CREATED = "order.created"
+ORDER_OVERDUE = "order.overdue"
+ORDER_EVENTS = {
+    "accepted": "order.accepted",
+    "cancelled": "order.cancelled",
+    "delivered": "order.delivered",
+}
+
+
+def customer_channel(user_id):
+    return "customer:{}".format(user_id)
+
+
+def restaurant_channel(restaurant_id):
+    return "restaurant:{}".format(restaurant_id)
+
+
+class Subscription:
+    """
+    Queue of the events published to a set of channels, consumed by one
+    connection in the event loop it was created in.
+    """
+
+    def __init__(self, hub, channels, loop, maxsize):
+        self.hub = hub
+        self.channels = channels
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        # A client too slow to keep up loses events instead of growing
+        # the memory of the worker without bound.
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class LocalEventHub:
+    """
+    In-process publish/subscribe hub.
+
+    Events only reach subscribers of the same process, a hub backed by a
+    message broker can replace it through the EVENTS_HUB setting.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, channels):
+        subscription = Subscription(
+            self,
+            channels,
+            asyncio.get_event_loop(),
+            settings.EVENTS_QUEUE_SIZE,
+        )
+        with self._lock:
+            for channel in channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscriptions = self._subscriptions.get(channel, set())
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    self._subscriptions.pop(channel, None)
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscriptions.get(channel, ()))
+
+
+_hub = None
+
+
+def get_event_hub():
+    global _hub
+    if _hub is None:
+        _hub = import_string(settings.EVENTS_HUB)()
+    return _hub
+
+
+def publish_order_event(order, name):
+    """
+    Publish an order event to its customer and restaurant once the current
+    transaction commits, and queue the ORDER_EVENT_TASKS of the event.
+    """
+    event = {
+        "event": name,
+        "data": {
+            "id": order.pk,
+            "status": order.status,
+            "customer": order.customer_id,
+            "restaurant": order.restaurant_id,
+        },
+    }
+
+    def publish():
+        hub = get_event_hub()
+        hub.publish(customer_channel(order.customer_id), event)
+        hub.publish(restaurant_channel(order.restaurant_id), event)
+
+    transaction.on_commit(publish)
+    for path in settings.ORDER_EVENT_TASKS.get(name, ()):
+        enqueue(path, order_id=order.pk, event=name)
+
+
+def format_event(event):
+    data = json.dumps(event["data"], cls=JSONEncoder)
+    return "event: {}\ndata: {}\n\n".format(event["event"], data).encode()
+
+
+def _user_id(scope):
+    """
+    Return the id of the user authenticated by the bearer token or the
+    session cookie of the request, or None.
+
+    Browsers can not set headers on an EventSource, so the token may also
+    come as the token query parameter.
+    """
+    headers = dict(scope.get("headers", []))
+    authorization = headers.get(b"authorization", b"").decode("latin1").split()
+    token = parse_qs(scope.get("query_string", b"").decode("latin1")).get("token")
+    if len(authorization) == 2 and authorization[0].lower() == TOKEN_KEYWORD.lower():
+        token = [authorization[1]]
+    if token:
+        try:
+            return read_token(token[0])["uid"]
+        except AuthenticationFailed:
+            return None
+
+    cookies = SimpleCookie()
+    cookies.load(headers.get(b"cookie", b"").decode("latin1"))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    user = get_user(SimpleNamespace(session=engine.SessionStore(morsel.value)))
+    return user.pk if user.is_authenticated else None
+
+
+def _load_channels(scope):
+    user_id = _user_id(scope)
+    if user_id is None:
+        return None
+    channels = [customer_channel(user_id)]
+    restaurant_id = (
+        Restaurant.objects.filter(manager=user_id).values_list("pk", flat=True).first()
+    )
+    if restaurant_id is not None:
+        channels.append(restaurant_channel(restaurant_id))
+    return channels
+
+
+async def order_events_application(scope, receive, send):
+    """
+    ASGI application streaming the order events of the user authenticated
+    by a bearer token or a session as Server-Sent Events.
+
+    Customers get the events of their own orders, managers also get the
+    events of their restaurant. A connection is a coroutine waiting on a
+    queue, so one worker holds many idle connections.
+    """
+    channels = await sync_to_async(_load_channels)(scope)
+    if channels is None:
+        await send({"type": "http.response.start", "status": 403, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+            ],
+        }
+    )
+    subscription = get_event_hub().subscribe(channels)
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    event = None
+    try:
+        while True:
+            if event is None:
+                event = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {event, disconnect},
+                timeout=settings.EVENTS_KEEPALIVE,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnect in done:
+                break
+            if event in done:
+                body = format_event(event.result())
+                event = None
+            else:
+                body = b": keepalive\n\n"
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+    finally:
+        subscription.close()
+        disconnect.cancel()
+        if event is not None:
+            event.cancel()
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
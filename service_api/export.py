@@ -0,0 +1,40 @@
+import heapq
+
+from django.conf import settings
+
+
+# Order columns of the exports, in order
+EXPORT_FIELDS = (
+    "id",
+    "customer_id",
+    "restaurant_id",
+    "status",
+    "total",
+    "create_datetime",
+    "accept_datetime",
+    "cancell_datetime",
+    "delivered_datetime",
+    "time_to_deliver",
+    "note",
+)
+
+
+def export_rows(history):
+    """
+    Return an iterator over the export columns of the live and archived
+    orders of an OrderHistory, oldest first.
+
+    Rows are fetched EXPORT_CHUNK_SIZE at a time from every store as plain
+    tuples and merged, so memory stays flat however many orders are
+    exported.
+    """
+    created = EXPORT_FIELDS.index("create_datetime")
+    return heapq.merge(
+        *(
+            orders.order_by("create_datetime", "id")
+            .values_list(*EXPORT_FIELDS)
+            .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+            for orders in history.querysets
+        ),
+        key=lambda row: (row[created], row[0]),
+    )
@@ -0,0 +1,38 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from service_api.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Move orders delivered or cancelled more than --days days ago, and "
+        "their items, to the archive tables in batches. With --interval the "
+        "command keeps running and archives again every interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS)
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--interval", type=int, help="Seconds to wait between two runs."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            cutoff = timezone.now() - datetime.timedelta(days=options["days"])
+            moved = archive_orders(cutoff, options["batch_size"])
+            self.stdout.write(
+                "Archived {} orders finished before {}.".format(
+                    moved, cutoff.isoformat()
+                )
+            )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.core.management.base import BaseCommand
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def summary(latencies, statuses, elapsed):
+    return {
+        "requests": len(latencies),
+        "errors": sum(1 for status in statuses if status >= 400),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput and latency of an endpoint served by the WSGI "
+        "and by the ASGI application. Requests are made in-process, without "
+        "a network server."
+    )
+
+    def add_arguments(self, parser):
+        # The restaurant list is served from the cache, search loads the
+        # restaurants of every page from the database.
+        parser.add_argument("--path", default="/api/v1/restaurants/search/?city=Tehran")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--cookie", default="", help="Cookie header, e.g. sessionid=..."
+        )
+
+    def handle(self, *args, **options):
+        results = {
+            "wsgi": self.run_wsgi(options),
+            "asgi": self.run_asgi(options),
+        }
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run_wsgi(self, options):
+        from django.core.wsgi import get_wsgi_application
+
+        application = get_wsgi_application()
+        path, _, query = options["path"].partition("?")
+
+        def request(_):
+            environ = {
+                "PATH_INFO": path,
+                "QUERY_STRING": query,
+                "HTTP_COOKIE": options["cookie"],
+                "SERVER_NAME": "localhost",
+            }
+            setup_testing_defaults(environ)
+            statuses = []
+            started = time.perf_counter()
+            body = application(
+                environ, lambda status, headers: statuses.append(int(status[:3]))
+            )
+            b"".join(body)
+            body.close()
+            return time.perf_counter() - started, statuses[0]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as executor:
+            results = list(executor.map(request, range(options["requests"])))
+        elapsed = time.perf_counter() - started
+        return summary([r[0] for r in results], [r[1] for r in results], elapsed)
+
+    def run_asgi(self, options):
+        from foodordering.asgi import application
+
+        path, _, query = options["path"].partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [
+                (b"host", b"localhost"),
+                (b"cookie", options["cookie"].encode()),
+            ],
+            "client": ("127.0.0.1", 0),
+            "server": ("localhost", 80),
+        }
+
+        async def request(semaphore):
+            async with semaphore:
+                messages = []
+
+                async def receive():
+                    return {"type": "http.request", "body": b"", "more_body": False}
+
+                async def send(message):
+                    messages.append(message)
+
+                started = time.perf_counter()
+                await application(dict(scope), receive, send)
+                return time.perf_counter() - started, messages[0]["status"]
+
+        async def run():
+            semaphore = asyncio.Semaphore(options["concurrency"])
+            return await asyncio.gather(
+                *(request(semaphore) for _ in range(options["requests"]))
+            )
+
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        return summary([r[0] for r in results], [r[1] for r in results], elapsed)
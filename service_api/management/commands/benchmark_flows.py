@@ -0,0 +1,236 @@
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from service_api.authentication import issue_token
+from service_api.management.commands.benchmark_asgi import percentile
+
+
+API_PREFIX = "/api/v1/"
+
+
+class ClientTransport:
+    """
+    Make requests in process through the Django test client, which also
+    lets the queries of every request be counted.
+    """
+
+    def __init__(self):
+        self.client = Client(SERVER_NAME="localhost")
+
+    def request(self, method, path, token, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method.lower())(
+                path,
+                data,
+                content_type="application/json",
+                HTTP_AUTHORIZATION="Bearer " + token,
+            )
+        body = None
+        if response.get("Content-Type") == "application/json":
+            body = response.json()
+        return response.status_code, body, len(context.captured_queries)
+
+
+class ServerTransport:
+    """
+    Make requests to a running server, query counts are not available.
+    """
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def request(self, method, path, token, data=None):
+        request = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(data).encode() if data is not None else None,
+            method=method,
+            headers={
+                "Authorization": "Bearer " + token,
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read() or b"null"), None
+        except urllib.error.HTTPError as exc:
+            return exc.code, None, None
+
+
+class Command(BaseCommand):
+    help = (
+        "Run scripted customer and manager flows against the API and report "
+        "throughput, latency percentiles and query counts per endpoint as "
+        "JSON. Users come from generate_data. The flows place, cancel and "
+        "accept real orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=100)
+        parser.add_argument("--prefix", default="bench")
+        parser.add_argument(
+            "--url", help="Base URL of a running server, e.g. http://127.0.0.1:8000"
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument(
+            "--baseline", help="Report of an earlier run to compare latencies with."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.transport = (
+            ServerTransport(options["url"]) if options["url"] else ClientTransport()
+        )
+        self.samples = {}
+        customers, managers = self.load_tokens(options["prefix"])
+
+        started = time.perf_counter()
+        for _ in range(options["iterations"]):
+            self.customer_flow(self.rng.choice(customers))
+            self.manager_flow(self.rng.choice(managers))
+        elapsed = time.perf_counter() - started
+
+        report = {
+            "transport": "server" if options["url"] else "client",
+            "iterations": options["iterations"],
+            "elapsed_s": round(elapsed, 3),
+            "requests_per_second": round(
+                sum(len(samples) for samples in self.samples.values()) / elapsed, 1
+            ),
+            "endpoints": {
+                name: self.summarize(samples)
+                for name, samples in sorted(self.samples.items())
+            },
+        }
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline:
+                report["changes"] = self.compare(json.load(baseline), report)
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+        self.stdout.write(output)
+
+    def load_tokens(self, prefix):
+        """
+        Issue tokens directly instead of logging in, logins are rate limited
+        and their hashing cost would dominate the flows.
+        """
+        customers = User.objects.filter(username__startswith=prefix + "-customer-")
+        managers = User.objects.filter(
+            username__startswith=prefix + "-manager-", restaurant__isnull=False
+        )
+        customers = [
+            issue_token(user) for user in customers.select_related("profile")[:100]
+        ]
+        managers = [
+            issue_token(user) for user in managers.select_related("profile")[:100]
+        ]
+        if not customers or not managers:
+            raise CommandError(
+                "No generated users with the prefix {!r}, run generate_data "
+                "first.".format(prefix)
+            )
+        return customers, managers
+
+    def call(self, name, method, path, token, data=None):
+        started = time.perf_counter()
+        status, body, queries = self.transport.request(
+            method, API_PREFIX + path, token, data
+        )
+        self.samples.setdefault(name, []).append(
+            (time.perf_counter() - started, status, queries)
+        )
+        return status, body
+
+    def customer_flow(self, token):
+        _, page = self.call("customer list restaurants", "GET", "restaurants/", token)
+        self.call("customer search restaurants", "GET", "restaurants/search/", token)
+        self.call("customer search foods", "GET", "foods/search/?q=chick", token)
+        restaurants = (page or {}).get("results")
+        menu = None
+        if restaurants:
+            restaurant = self.rng.choice(restaurants)["id"]
+            path = "restaurants/{}/foods/".format(restaurant)
+            _, menu = self.call("customer menu", "GET", path, token)
+        if menu:
+            foods = [food["id"] for food in self.rng.sample(menu, min(2, len(menu)))]
+            status, order = self.call(
+                "customer place order",
+                "POST",
+                "customer/neworder/",
+                token,
+                {"foods": foods},
+            )
+            if status == 201 and self.rng.random() < 0.2:
+                self.call(
+                    "customer cancel order",
+                    "PUT",
+                    "customer/cancell/{}/".format(order["id"]),
+                    token,
+                    {"is_cancelled": True},
+                )
+        self.call("customer active orders", "GET", "customer/activeorders/", token)
+        self.call(
+            "customer delivered orders", "GET", "customer/deliveredorders/", token
+        )
+
+    def manager_flow(self, token):
+        _, page = self.call(
+            "manager active orders", "GET", "manager/activeorders/", token
+        )
+        pending = [
+            order["id"]
+            for order in (page or {}).get("results", [])
+            if not order["is_accepted"]
+        ]
+        if pending:
+            self.call(
+                "manager accept order",
+                "PUT",
+                "manager/accept/{}/".format(pending[0]),
+                token,
+                {"is_accepted": True, "time_to_deliver": 30},
+            )
+        self.call("manager delivered orders", "GET", "manager/deliveredorders/", token)
+        self.call("manager foods", "GET", "manager/foods/", token)
+
+    def summarize(self, samples):
+        latencies = [sample[0] for sample in samples]
+        queries = [sample[2] for sample in samples if sample[2] is not None]
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for sample in samples if sample[1] >= 400),
+            "requests_per_second": round(len(samples) / sum(latencies), 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "queries_avg": round(sum(queries) / len(queries), 2) if queries else None,
+            "queries_max": max(queries) if queries else None,
+        }
+
+    def compare(self, baseline, report):
+        """
+        Return the ratio of every latency percentile to the baseline's.
+        """
+        changes = {}
+        for name, current in report["endpoints"].items():
+            previous = baseline.get("endpoints", {}).get(name)
+            if not previous:
+                continue
+            changes[name] = {
+                key: round(current[key] / previous[key], 2)
+                for key in ("p50_ms", "p95_ms", "p99_ms")
+                if previous[key]
+            }
+        return changes
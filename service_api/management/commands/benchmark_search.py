@@ -0,0 +1,94 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from service_api.models import Restaurant
+from service_api.search import RestaurantIndex, open_at_q
+
+
+CITIES = ["Tehran", "Mashhad", "Isfahan", "Karaj", "Shiraz", "Tabriz", "Qom"]
+FOOD_TYPES = ["Persian", "Italian", "Fast Food", "Chinese", "Seafood", "Vegan"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare restaurant search through RestaurantIndex with the plain ORM "
+        "filter. Test restaurants are created in a transaction which is "
+        "rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--restaurants", type=int, default=100000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            self.create_restaurants(rng, options["restaurants"])
+            queries = [
+                (
+                    rng.choice(CITIES),
+                    rng.choice(FOOD_TYPES),
+                    datetime.time(rng.randrange(24), rng.randrange(60)),
+                )
+                for _ in range(options["queries"])
+            ]
+
+            index = RestaurantIndex()
+            started = time.perf_counter()
+            index.search()
+            build_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            index_results = [index.search(*query) for query in queries]
+            index_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            orm_results = [
+                list(
+                    Restaurant.objects.filter(
+                        open_at_q(at), city=city, food_type=food_type
+                    )
+                    .order_by("pk")
+                    .values_list("pk", flat=True)
+                )
+                for city, food_type, at in queries
+            ]
+            orm_time = time.perf_counter() - started
+            transaction.set_rollback(True)
+
+        if index_results != orm_results:
+            self.stderr.write("Index and ORM results differ.")
+        count = len(queries)
+        self.stdout.write("index build: {:.3f}s".format(build_time))
+        self.stdout.write("index: {:.3f} ms/query".format(index_time * 1000 / count))
+        self.stdout.write("orm: {:.3f} ms/query".format(orm_time * 1000 / count))
+
+    def create_restaurants(self, rng, count):
+        last_user = User.objects.order_by("-pk").first()
+        User.objects.bulk_create(
+            (User(username="benchmark-{}".format(index)) for index in range(count)),
+            batch_size=2000,
+        )
+        managers = User.objects.filter(
+            pk__gt=last_user.pk if last_user else 0
+        ).values_list("pk", flat=True)
+        restaurants = []
+        for manager_id in managers.iterator():
+            restaurants.append(
+                Restaurant(
+                    manager_id=manager_id,
+                    name="Restaurant {}".format(manager_id),
+                    food_type=rng.choice(FOOD_TYPES),
+                    city=rng.choice(CITIES),
+                    address="Street",
+                    open_time=datetime.time(rng.randrange(24), rng.choice((0, 30))),
+                    close_time=datetime.time(rng.randrange(24), rng.choice((0, 30))),
+                )
+            )
+        Restaurant.objects.bulk_create(restaurants, batch_size=2000)
@@ -0,0 +1,269 @@
+import contextlib
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from service_api.cache import bump_catalogue_version
+from service_api.models import (
+    Profile,
+    Restaurant,
+    Food,
+    Order,
+    OrderItem,
+    ArchivedOrder,
+    RestaurantDailyStats,
+)
+from service_api.stats import rebuild_stats
+
+
+CITIES = ["Tehran", "Mashhad", "Isfahan", "Karaj", "Shiraz", "Tabriz", "Qom"]
+FOOD_TYPES = ["Persian", "Italian", "Fast Food", "Chinese", "Seafood", "Vegan"]
+DISH_WORDS = [
+    ["Chicken", "Beef", "Lamb", "Veggie", "Shrimp", "Mushroom", "Saffron"],
+    ["Kebab", "Pizza", "Burger", "Stew", "Noodles", "Salad", "Rice", "Wrap"],
+]
+
+# Share of generated orders in each status, most orders are finished ones
+STATUS_WEIGHTS = (
+    (Order.DELIVERED, 70),
+    (Order.CANCELLED, 12),
+    (Order.ACCEPTED, 10),
+    (Order.PENDING, 8),
+)
+
+
+def next_pk(*models):
+    # Archived orders keep their ids, so both tables count for new orders.
+    return max(model.objects.aggregate(pk=Max("pk"))["pk"] or 0 for model in models) + 1
+
+
+@contextlib.contextmanager
+def keep_create_datetime():
+    # bulk_create stamps auto_now_add fields with the current time, which
+    # would put every generated order in the same second.
+    field = Order._meta.get_field("create_datetime")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate customers, managers with their restaurants and foods, and "
+        "orders spread over the past days, using bulk inserts. Every user "
+        "gets the same password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=1000)
+        parser.add_argument("--restaurants", type=int, default=100)
+        parser.add_argument("--foods", type=int, default=20, help="Per restaurant.")
+        parser.add_argument("--orders", type=int, default=100000)
+        parser.add_argument("--days", type=int, default=90)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--prefix", default="bench")
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options["prefix"] + "-").exists():
+            raise CommandError(
+                "Users with the prefix {!r} already exist.".format(options["prefix"])
+            )
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            customers = self.create_users(
+                options["prefix"] + "-customer", options["customers"], options
+            )
+            managers = self.create_users(
+                options["prefix"] + "-manager",
+                options["restaurants"],
+                options,
+                is_manager=True,
+            )
+            menus = self.create_restaurants(managers, options["foods"])
+        self.create_orders(customers, menus, options["orders"], options["days"])
+        # Bulk inserts skip the incremental rollup updates.
+        restaurants = list(menus)
+        for start in range(0, len(restaurants), 100):
+            rebuild_stats(
+                Order,
+                RestaurantDailyStats,
+                restaurants[start : start + 100],
+                archive_model=ArchivedOrder,
+            )
+        self.reset_sequences()
+        bump_catalogue_version()
+
+        self.stdout.write(
+            "Generated {} customers, {} restaurants and {} orders in {:.1f}s.".format(
+                len(customers),
+                len(menus),
+                options["orders"],
+                time.perf_counter() - started,
+            )
+        )
+
+    def create_users(self, username, count, options, is_manager=False):
+        # Hashing once keeps generation fast, the hash is valid for everyone.
+        password = make_password(options["password"])
+        first = next_pk(User)
+        users = [
+            User(
+                pk=pk,
+                username="{}-{}".format(username, pk - first),
+                first_name="First{}".format(pk),
+                last_name="Last{}".format(pk),
+                password=password,
+            )
+            for pk in range(first, first + count)
+        ]
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        Profile.objects.bulk_create(
+            [
+                Profile(
+                    user_id=user.pk,
+                    gender=self.rng.choice("MF"),
+                    city=self.rng.choice(CITIES),
+                    is_manager=is_manager,
+                )
+                for user in users
+            ],
+            batch_size=self.batch_size,
+        )
+        return [user.pk for user in users]
+
+    def create_restaurants(self, managers, foods_per_restaurant):
+        """
+        Create a restaurant for every manager and return its foods as
+        {restaurant pk: [(food pk, price), ...]}.
+        """
+        first = next_pk(Restaurant)
+        restaurants = []
+        for pk, manager in enumerate(managers, first):
+            opens = self.rng.randrange(6, 13)
+            restaurants.append(
+                Restaurant(
+                    pk=pk,
+                    manager_id=manager,
+                    name="Restaurant {}".format(pk),
+                    food_type=self.rng.choice(FOOD_TYPES),
+                    city=self.rng.choice(CITIES),
+                    address="Street {}".format(pk),
+                    open_time=datetime.time(opens),
+                    close_time=datetime.time((opens + self.rng.randrange(8, 16)) % 24),
+                )
+            )
+        Restaurant.objects.bulk_create(restaurants, batch_size=self.batch_size)
+
+        food_pk = next_pk(Food)
+        foods = []
+        menus = {}
+        for restaurant in restaurants:
+            menu = menus[restaurant.pk] = []
+            for _ in range(foods_per_restaurant):
+                price = Decimal(self.rng.randrange(200, 5000)) / 100
+                foods.append(
+                    Food(
+                        pk=food_pk,
+                        restaurant_id=restaurant.pk,
+                        name=" ".join(self.rng.choice(words) for words in DISH_WORDS),
+                        price=price,
+                        is_vegan=self.rng.random() < 0.15,
+                        is_organic=self.rng.random() < 0.2,
+                    )
+                )
+                menu.append((food_pk, price))
+                food_pk += 1
+        Food.objects.bulk_create(foods, batch_size=self.batch_size)
+        return menus
+
+    def create_orders(self, customers, menus, count, days):
+        restaurants = [pk for pk, menu in menus.items() if menu]
+        if not restaurants or not customers:
+            return
+        statuses, weights = zip(*STATUS_WEIGHTS)
+        now = timezone.now()
+        order_pk = next_pk(Order, ArchivedOrder)
+        end = order_pk + count
+
+        with keep_create_datetime():
+            while order_pk < end:
+                orders = []
+                items = []
+                for pk in range(order_pk, min(order_pk + self.batch_size, end)):
+                    restaurant = self.rng.choice(restaurants)
+                    order = self.build_order(pk, now, days, statuses, weights)
+                    order.customer_id = self.rng.choice(customers)
+                    order.restaurant_id = restaurant
+                    menu = menus[restaurant]
+                    for food, price in self.rng.sample(
+                        menu, min(len(menu), self.rng.randint(1, 3))
+                    ):
+                        quantity = self.rng.randint(1, 3)
+                        items.append(
+                            OrderItem(
+                                order_id=pk,
+                                food_id=food,
+                                quantity=quantity,
+                                unit_price=price,
+                            )
+                        )
+                        order.total += price * quantity
+                    orders.append(order)
+                with transaction.atomic():
+                    Order.objects.bulk_create(orders)
+                    OrderItem.objects.bulk_create(items)
+                order_pk += len(orders)
+                self.stdout.write("{} orders".format(order_pk - end + count))
+
+    def build_order(self, pk, now, days, statuses, weights):
+        status = self.rng.choices(statuses, weights)[0]
+        created = now - datetime.timedelta(seconds=self.rng.randrange(days * 86400))
+        order = Order(
+            pk=pk,
+            status=status,
+            create_datetime=created,
+            time_to_deliver=self.rng.randrange(15, 90),
+            total=Decimal("0"),
+        )
+        if status == Order.CANCELLED:
+            order.cancell_datetime = created + datetime.timedelta(
+                minutes=self.rng.randrange(1, 20)
+            )
+        elif status != Order.PENDING:
+            order.accept_datetime = created + datetime.timedelta(
+                minutes=self.rng.randrange(1, 10)
+            )
+            order.due_datetime = order.accept_datetime + datetime.timedelta(
+                minutes=order.time_to_deliver
+            )
+            if status == Order.DELIVERED:
+                order.delivered_datetime = order.accept_datetime + datetime.timedelta(
+                    minutes=order.time_to_deliver + self.rng.randrange(-10, 20)
+                )
+        return order
+
+    def reset_sequences(self):
+        # Rows were inserted with explicit primary keys, which leaves the
+        # sequences of server databases behind.
+        sql = connection.ops.sequence_reset_sql(
+            no_style(), [User, Profile, Restaurant, Food, Order, OrderItem]
+        )
+        with connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from service_api.search import install_food_search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text dish search index and its sync triggers."
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            self.stderr.write("Dish search index is only used with SQLite.")
+            return
+        with transaction.atomic():
+            install_food_search(connection)
+        self.stdout.write("Dish search index rebuilt.")
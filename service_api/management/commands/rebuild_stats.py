@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from service_api.models import (
+    Restaurant,
+    Order,
+    ArchivedOrder,
+    RestaurantDailyStats,
+)
+from service_api.stats import rebuild_all_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per restaurant, per day order rollups from the live and "
+        "archived orders, a chunk of restaurants at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        written = rebuild_all_stats(
+            Restaurant,
+            Order,
+            RestaurantDailyStats,
+            options["chunk_size"],
+            archive_model=ArchivedOrder,
+        )
+        self.stdout.write("Rebuilt {} daily rollups.".format(written))
@@ -0,0 +1,78 @@
+import multiprocessing
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from service_api.tasks import claim_tasks, run_task
+
+
+def run(pk):
+    # Connections of the pool are recycled like the ones of requests.
+    try:
+        return run_task(pk)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks with a pool of threads, or of processes "
+        "with --processes, until interrupted. Several workers may run at the "
+        "same time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.TASK_WORKERS)
+        parser.add_argument(
+            "--processes",
+            action="store_true",
+            help="Run tasks in processes, for CPU bound tasks.",
+        )
+        parser.add_argument("--poll", type=float, default=settings.TASK_POLL_INTERVAL)
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once no task is due."
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if options["processes"]:
+            # Spawned processes share no database connection with this one.
+            pool = ProcessPoolExecutor(
+                workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        else:
+            pool = ThreadPoolExecutor(workers)
+        succeeded = failed = 0
+        running = set()
+        with pool:
+            while True:
+                # Claim as many tasks as there are free workers, so a slow
+                # task does not hold back the others.
+                pks = claim_tasks(workers - len(running))
+                running |= {pool.submit(run, pk) for pk in pks}
+                if not running:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll"])
+                    continue
+                # Poll again after a while when some workers are idle.
+                timeout = options["poll"] if len(running) < workers else None
+                done, running = wait(running, timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if result:
+                        succeeded += 1
+                    elif result is not None:
+                        failed += 1
+        self.stdout.write("Ran {} tasks, {} failed.".format(succeeded + failed, failed))
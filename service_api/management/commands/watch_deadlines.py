@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from service_api.deadlines import DeadlineScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Flag accepted orders as overdue as soon as their delivery deadline "
+        "passes and publish an order.overdue event for each, until "
+        "interrupted. Run a single scheduler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--horizon", type=int, default=settings.DEADLINE_HORIZON)
+        parser.add_argument("--refresh", type=int, default=settings.DEADLINE_REFRESH)
+        parser.add_argument(
+            "--once", action="store_true", help="Flag the orders overdue now and exit."
+        )
+
+    def handle(self, *args, **options):
+        scheduler = DeadlineScheduler(options["horizon"], options["refresh"])
+        while True:
+            now = timezone.now()
+            flagged = scheduler.run_pending(now)
+            if flagged or options["once"]:
+                self.stdout.write("Flagged {} overdue orders.".format(len(flagged)))
+            if options["once"]:
+                return
+            delay = (scheduler.wake_up_at() - timezone.now()).total_seconds()
+            time.sleep(max(delay, 0))
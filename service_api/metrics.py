@@ -0,0 +1,239 @@
+import asyncio
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = "service_api_"
+QUANTILES = (0.5, 0.95, 0.99)
+
+DURATION_BOUNDS = tuple(0.001 * 2 ** i for i in range(17))
+COUNT_BOUNDS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 48, 64, 96, 128, 256, 512)
+SIZE_BOUNDS = tuple(64 * 2 ** i for i in range(19))
+
+# Name, help text and bucket bounds of every per view metric
+METRICS = (
+    ("request_duration_seconds", "Wall time of requests.", DURATION_BOUNDS),
+    ("db_queries", "Database queries run by requests.", COUNT_BOUNDS),
+    ("db_duration_seconds", "Time requests spent in the database.", DURATION_BOUNDS),
+    ("response_size_bytes", "Size of response bodies.", SIZE_BOUNDS),
+)
+
+
+class Histogram:
+    """
+    Count of observations per bucket, quantiles are interpolated inside
+    the bucket they fall in.
+
+    Memory and the cost of an observation stay constant however many
+    requests are recorded.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = self.bounds[index - 1] if index else 0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    In process histograms of every metric per view name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, *values):
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = [
+                    Histogram(bounds) for _, _, bounds in METRICS
+                ]
+            for histogram, value in zip(histograms, values):
+                histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def render(self):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            views = sorted(self._views.items())
+            for position, (name, help_text, _) in enumerate(METRICS):
+                name = METRICS_PREFIX + name
+                lines.append("# HELP {} {}".format(name, help_text))
+                lines.append("# TYPE {} summary".format(name))
+                for view, histograms in views:
+                    histogram = histograms[position]
+                    label = 'view="{}"'.format(_escape(view))
+                    for q in QUANTILES:
+                        lines.append(
+                            '{}{{{},quantile="{}"}} {}'.format(
+                                name, label, q, _number(histogram.quantile(q))
+                            )
+                        )
+                    lines.append(
+                        "{}_sum{{{}}} {}".format(name, label, _number(histogram.sum))
+                    )
+                    lines.append(
+                        "{}_count{{{}}} {}".format(name, label, histogram.count)
+                    )
+        return "\n".join(lines) + "\n"
+
+
+def render_gauges(gauges):
+    """
+    Return (name, help text, value) gauges in the Prometheus text format.
+    """
+    lines = []
+    for name, help_text, value in gauges:
+        name = METRICS_PREFIX + name
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} gauge".format(name))
+        lines.append("{} {}".format(name, _number(value)))
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return "{:.6g}".format(value)
+
+
+registry = MetricsRegistry()
+
+
+# Counter of the current request, context variables follow the request
+# into the threads sync_to_async runs its database access in.
+_query_counter = contextvars.ContextVar("query_counter", default=None)
+
+
+class QueryCounter:
+    """
+    Count of the queries of a request and the time they take.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    Database execute wrapper, installed on every connection, which feeds
+    the QueryCounter of the current request.
+    """
+    counter = _query_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.count += 1
+        counter.duration += time.perf_counter() - start
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name
+
+
+class MetricsMiddleware:
+    """
+    Record wall time, queries, database time and response size of every
+    request under the name of the view which served it.
+
+    Requests over METRICS_LATENCY_BUDGET seconds or METRICS_QUERY_BUDGET
+    queries are logged as warnings, a budget of None disables its check.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells the handler this middleware is called as a coroutine.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = QueryCounter()
+        token = _query_counter.set(counter)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_counter.reset(token)
+        self.record(request, response, time.perf_counter() - start, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        token = _query_counter.set(counter)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_counter.reset(token)
+        self.record(request, response, time.perf_counter() - start, counter)
+        return response
+
+    def record(self, request, response, duration, counter):
+        view = _view_name(request)
+        size = 0 if response.streaming else len(response.content)
+        registry.record(view, duration, counter.count, counter.duration, size)
+
+        latency_budget = settings.METRICS_LATENCY_BUDGET
+        query_budget = settings.METRICS_QUERY_BUDGET
+        if (latency_budget is not None and duration > latency_budget) or (
+            query_budget is not None and counter.count > query_budget
+        ):
+            logger.warning(
+                "%s %s (%s) over budget: %.3fs, %d queries, %.3fs in database",
+                request.method,
+                request.path,
+                view,
+                duration,
+                counter.count,
+                counter.duration,
+            )
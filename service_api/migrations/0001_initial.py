@@ -0,0 +1,75 @@
+# Generated by Django 3.1.5 on 2026-10-18 08:45
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Food',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('is_organic', models.BooleanField(default=False)),
+                ('is_vegan', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Restaurant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('food_type', models.CharField(max_length=255)),
+                ('city', models.CharField(max_length=255)),
+                ('address', models.CharField(max_length=1024)),
+                ('open_time', models.TimeField()),
+                ('close_time', models.TimeField()),
+                ('manager', models.OneToOneField(on_delete=django.db.models.deletion.RESTRICT, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('birth_date', models.DateField(blank=True, null=True)),
+                ('gender', models.CharField(choices=[('M', 'Male'), ('F', 'Female')], max_length=1)),
+                ('phone_number', models.CharField(blank=True, max_length=17, validators=[django.core.validators.RegexValidator(message="format: '+999999999'. Up to 15 digits allowed.", regex='^\\+?1?\\d{9,15}$')])),
+                ('city', models.CharField(max_length=255)),
+                ('is_manager', models.BooleanField(default=False)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_accepted', models.BooleanField(default=False)),
+                ('is_cancelled', models.BooleanField(default=False)),
+                ('is_delivered', models.BooleanField(default=False)),
+                ('create_datetime', models.DateTimeField(auto_now_add=True)),
+                ('accept_datetime', models.DateTimeField(blank=True, default=None, null=True)),
+                ('cancell_datetime', models.DateTimeField(blank=True, default=None, null=True)),
+                ('delivered_datetime', models.DateTimeField(blank=True, default=None, null=True)),
+                ('note', models.CharField(default='', max_length=1024)),
+                ('time_to_deliver', models.IntegerField(default=30, validators=[django.core.validators.MinValueValidator(1)])),
+                ('customer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('foods', models.ManyToManyField(to='service_api.Food')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='restaurant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='service_api.restaurant'),
+        ),
+    ]
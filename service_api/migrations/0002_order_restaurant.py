@@ -0,0 +1,51 @@
+# Generated by Django 3.1.5 on 2026-10-18 08:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_order_restaurant(apps, schema_editor):
+    """
+    Copy the restaurant of each order's foods onto the order itself.
+    """
+    Order = apps.get_model("service_api", "Order")
+    OrderFoods = Order.foods.through
+    last_pk = 0
+    while True:
+        batch = list(
+            Order.objects.filter(pk__gt=last_pk, restaurant__isnull=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        restaurants = dict(
+            OrderFoods.objects.filter(order_id__in=batch)
+            .order_by("order_id", "id")
+            .values_list("order_id", "food__restaurant_id")
+        )
+        by_restaurant = {}
+        for order_id, restaurant_id in restaurants.items():
+            by_restaurant.setdefault(restaurant_id, []).append(order_id)
+        for restaurant_id, order_ids in by_restaurant.items():
+            Order.objects.filter(pk__in=order_ids).update(restaurant_id=restaurant_id)
+        last_pk = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, to='service_api.restaurant'),
+        ),
+        migrations.RunPython(backfill_order_restaurant, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.1.5 on 2026-10-18 08:46
+
+from django.db import migrations, models, transaction
+
+
+BATCH_SIZE = 1000
+
+
+def fill_order_status(apps, schema_editor):
+    """
+    Convert is_accepted, is_cancelled and is_delivered flags into status.
+
+    Orders are converted in primary key ranges, each range in its own
+    transaction, so the table is never locked for the whole conversion.
+    The flags are only dropped by 0013, so they stay readable meanwhile.
+    """
+    Order = apps.get_model("service_api", "Order")
+    last_pk = 0
+    while True:
+        batch = list(
+            Order.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        orders = Order.objects.filter(pk__gte=batch[0], pk__lte=batch[-1])
+        with transaction.atomic():
+            orders.filter(is_accepted=True).update(status="accepted")
+            orders.filter(is_delivered=True).update(status="delivered")
+            orders.filter(is_cancelled=True).update(status="cancelled")
+        last_pk = batch[-1]
+
+
+def fill_order_flags(apps, schema_editor):
+    Order = apps.get_model("service_api", "Order")
+    Order.objects.filter(status__in=["accepted", "delivered"]).update(
+        is_accepted=True
+    )
+    Order.objects.filter(status="delivered").update(is_delivered=True)
+    Order.objects.filter(status="cancelled").update(is_cancelled=True)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('service_api', '0002_order_restaurant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('cancelled', 'Cancelled'), ('delivered', 'Delivered')], default='pending', max_length=16),
+        ),
+        migrations.RunPython(fill_order_status, fill_order_flags),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'status', 'create_datetime'], name='order_customer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['restaurant', 'status', 'create_datetime'], name='order_restaurant_status_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+from django.db import migrations
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    """
+    RunSQL which only runs on SQLite, the FTS5 index has no counterpart on
+    the other databases.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+# A copy of the index as it was created at this point of the history, later
+# changes go to service_api.search and the rebuild_food_search command.
+FOOD_SEARCH_SQL = [
+    "CREATE VIRTUAL TABLE service_api_food_fts USING fts5(name, restaurant_name, food_type)",
+    """
+    CREATE TRIGGER service_api_food_fts_food_insert
+    AFTER INSERT ON service_api_food BEGIN
+        INSERT INTO service_api_food_fts (rowid, name, restaurant_name, food_type)
+        SELECT new.id, new.name, r.name, r.food_type
+        FROM service_api_restaurant r WHERE r.id = new.restaurant_id;
+    END
+    """,
+    """
+    CREATE TRIGGER service_api_food_fts_food_update
+    AFTER UPDATE OF name, restaurant_id ON service_api_food BEGIN
+        DELETE FROM service_api_food_fts WHERE rowid = old.id;
+        INSERT INTO service_api_food_fts (rowid, name, restaurant_name, food_type)
+        SELECT new.id, new.name, r.name, r.food_type
+        FROM service_api_restaurant r WHERE r.id = new.restaurant_id;
+    END
+    """,
+    """
+    CREATE TRIGGER service_api_food_fts_food_delete
+    AFTER DELETE ON service_api_food BEGIN
+        DELETE FROM service_api_food_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER service_api_food_fts_restaurant_update
+    AFTER UPDATE OF name, food_type ON service_api_restaurant BEGIN
+        UPDATE service_api_food_fts
+        SET restaurant_name = new.name, food_type = new.food_type
+        WHERE rowid IN (
+            SELECT id FROM service_api_food WHERE restaurant_id = new.id
+        );
+    END
+    """,
+    """
+    INSERT INTO service_api_food_fts (rowid, name, restaurant_name, food_type)
+    SELECT f.id, f.name, r.name, r.food_type
+    FROM service_api_food f
+    JOIN service_api_restaurant r ON r.id = f.restaurant_id
+    """,
+]
+
+DROP_FOOD_SEARCH_SQL = [
+    'DROP TRIGGER IF EXISTS service_api_food_fts_food_insert',
+    'DROP TRIGGER IF EXISTS service_api_food_fts_food_update',
+    'DROP TRIGGER IF EXISTS service_api_food_fts_food_delete',
+    'DROP TRIGGER IF EXISTS service_api_food_fts_restaurant_update',
+    'DROP TABLE IF EXISTS service_api_food_fts',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_api', '0003_order_status'),
+    ]
+
+    operations = [
+        SQLiteRunSQL(FOOD_SEARCH_SQL, DROP_FOOD_SEARCH_SQL),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 3.1.5 on 2026-10-18 08:58
+
+import django.core.validators
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+from django.db.models import (
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+
+
+BATCH_SIZE = 1000
+
+TOTAL_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def copy_order_foods(apps, schema_editor):
+    """
+    Turn the plain order foods links into order items, priced at the
+    current food price, and store the total of each order.
+
+    Orders are converted in primary key ranges, each in its own
+    transaction.
+    """
+    Order = apps.get_model("service_api", "Order")
+    OrderItem = apps.get_model("service_api", "OrderItem")
+    OrderFoods = Order.foods.through
+    order_totals = (
+        OrderItem.objects.filter(order=OuterRef("pk"))
+        .values("order")
+        .annotate(
+            total=Sum(
+                ExpressionWrapper(
+                    F("unit_price") * F("quantity"),
+                    output_field=TOTAL_FIELD,
+                )
+            )
+        )
+        .values("total")
+    )
+    last_pk = 0
+    while True:
+        batch = list(
+            Order.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        links = OrderFoods.objects.filter(order_id__in=batch).values_list(
+            "order_id", "food_id", "food__price"
+        )
+        with transaction.atomic():
+            OrderItem.objects.bulk_create(
+                OrderItem(order_id=order_id, food_id=food_id, unit_price=price)
+                for order_id, food_id, price in links
+            )
+            Order.objects.filter(pk__in=batch).update(
+                total=Coalesce(
+                    Subquery(order_totals), Value(0), output_field=TOTAL_FIELD
+                )
+            )
+        last_pk = batch[-1]
+
+
+def copy_order_items(apps, schema_editor):
+    Order = apps.get_model("service_api", "Order")
+    OrderItem = apps.get_model("service_api", "OrderItem")
+    Order.foods.through.objects.bulk_create(
+        Order.foods.through(order_id=order_id, food_id=food_id)
+        for order_id, food_id in OrderItem.objects.values_list("order_id", "food_id")
+    )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('service_api', '0004_food_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('food', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='service_api.food')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='service_api.order')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'food'), name='orderitem_order_food_unique'),
+        ),
+        migrations.RunPython(copy_order_foods, copy_order_items),
+        # Django can not add a through model to an existing many to many
+        # field, so the old link table is dropped and the field re-added.
+        migrations.RemoveField(
+            model_name='order',
+            name='foods',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='foods',
+            field=models.ManyToManyField(through='service_api.OrderItem', to='service_api.Food'),
+        ),
+    ]
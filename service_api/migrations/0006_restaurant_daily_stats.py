@@ -0,0 +1,119 @@
+# Generated by Django 3.1.5 on 2026-10-18 09:20
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+# Restaurants whose rollups are computed in one transaction
+BATCH_SIZE = 100
+
+
+def build_restaurant_stats(Order, RestaurantDailyStats, restaurant_ids):
+    # A frozen copy of the rollup rebuild, so later changes to the app code
+    # do not change what this migration computes.
+    orders = Order.objects.filter(restaurant_id__in=restaurant_ids)
+    rows = defaultdict(dict)
+
+    def add(queryset, datetime_field, **aggregates):
+        grouped = (
+            queryset.annotate(
+                day=TruncDate(Coalesce(datetime_field, "create_datetime"))
+            )
+            .values("restaurant_id", "day")
+            .annotate(**aggregates)
+            .order_by()
+        )
+        for row in grouped:
+            key = (row.pop("restaurant_id"), row.pop("day"))
+            rows[key].update(row)
+
+    add(orders, "create_datetime", placed_orders=Count("pk"))
+    add(
+        orders.filter(status__in=("accepted", "delivered")),
+        "accept_datetime",
+        accepted_orders=Count("pk"),
+    )
+    add(
+        orders.filter(status="cancelled"),
+        "cancell_datetime",
+        cancelled_orders=Count("pk"),
+    )
+    add(
+        orders.filter(status="delivered"),
+        "delivered_datetime",
+        delivered_orders=Count("pk"),
+        revenue=Sum("total"),
+        deliver_time=Sum(
+            ExpressionWrapper(
+                F("delivered_datetime") - F("accept_datetime"),
+                output_field=DurationField(),
+            )
+        ),
+        timed_deliveries=Count(
+            "pk",
+            filter=Q(accept_datetime__isnull=False, delivered_datetime__isnull=False),
+        ),
+    )
+
+    rollups = []
+    for (restaurant_id, day), row in rows.items():
+        deliver_time = row.pop("deliver_time", None)
+        if deliver_time is not None:
+            row["deliver_seconds"] = int(deliver_time.total_seconds())
+        row["revenue"] = row.get("revenue") or Decimal("0")
+        rollups.append(
+            RestaurantDailyStats(restaurant_id=restaurant_id, day=day, **row)
+        )
+    RestaurantDailyStats.objects.bulk_create(rollups)
+
+
+def build_stats(apps, schema_editor):
+    Restaurant = apps.get_model("service_api", "Restaurant")
+    Order = apps.get_model("service_api", "Order")
+    RestaurantDailyStats = apps.get_model("service_api", "RestaurantDailyStats")
+    restaurant_ids = Restaurant.objects.order_by("pk").values_list("pk", flat=True)
+    last_pk = 0
+    while True:
+        chunk = list(restaurant_ids.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not chunk:
+            return
+        with transaction.atomic():
+            build_restaurant_stats(Order, RestaurantDailyStats, chunk)
+        last_pk = chunk[-1]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('service_api', '0005_order_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('placed_orders', models.PositiveIntegerField(default=0)),
+                ('accepted_orders', models.PositiveIntegerField(default=0)),
+                ('cancelled_orders', models.PositiveIntegerField(default=0)),
+                ('delivered_orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('deliver_seconds', models.BigIntegerField(default=0)),
+                ('timed_deliveries', models.PositiveIntegerField(default=0)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='service_api.restaurant')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='restaurantdailystats',
+            constraint=models.UniqueConstraint(fields=('restaurant', 'day'), name='restaurantdailystats_unique'),
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.1.5 on 2026-10-18 09:32
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('service_api', '0007_order_created_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('cancelled', 'Cancelled'), ('delivered', 'Delivered')], default='pending', max_length=16)),
+                ('accept_datetime', models.DateTimeField(blank=True, default=None, null=True)),
+                ('cancell_datetime', models.DateTimeField(blank=True, default=None, null=True)),
+                ('delivered_datetime', models.DateTimeField(blank=True, default=None, null=True)),
+                ('note', models.CharField(default='', max_length=1024)),
+                ('time_to_deliver', models.IntegerField(default=30, validators=[django.core.validators.MinValueValidator(1)])),
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('create_datetime', models.DateTimeField()),
+                ('customer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('restaurant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, to='service_api.restaurant')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('food', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='service_api.food')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='service_api.archivedorder')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['customer', 'status', 'create_datetime'], name='archivedorder_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['restaurant', 'status', 'create_datetime'], name='archivedorder_restaurant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['create_datetime'], name='archivedorder_created_idx'),
+        ),
+    ]
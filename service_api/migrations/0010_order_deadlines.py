@@ -0,0 +1,62 @@
+# Generated by Django 3.1.5 on 2026-10-18 09:38
+
+import datetime
+
+from django.db import migrations, models
+
+
+def set_due_datetimes(apps, schema_editor):
+    # One UPDATE per delivery time in use, instead of per row arithmetic.
+    Order = apps.get_model("service_api", "Order")
+    accepted = Order.objects.filter(accept_datetime__isnull=False)
+    minutes = accepted.order_by().values_list("time_to_deliver", flat=True)
+    for value in minutes.distinct():
+        accepted.filter(time_to_deliver=value).update(
+            due_datetime=models.ExpressionWrapper(
+                models.F("accept_datetime")
+                + models.Value(
+                    datetime.timedelta(minutes=value),
+                    output_field=models.DurationField(),
+                ),
+                output_field=models.DateTimeField(),
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_api', '0009_task_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='due_datetime',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='overdue_datetime',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='due_datetime',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='overdue_datetime',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(status='accepted'), fields=['restaurant', 'due_datetime'], name='order_restaurant_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('overdue_datetime__isnull', True), ('status', 'accepted')), fields=['due_datetime'], name='order_unflagged_due_idx'),
+        ),
+        migrations.RunPython(set_due_datetimes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.1.5 on 2026-10-18 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_api', '0010_order_deadlines'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('jti', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('expire_datetime', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.1.5 on 2026-10-18 14:12
+
+import datetime
+
+from django.db import migrations, models
+
+
+def set_due_datetimes(apps, schema_editor):
+    # 0010 only backfilled live orders, archived ones kept a NULL deadline.
+    ArchivedOrder = apps.get_model("service_api", "ArchivedOrder")
+    accepted = ArchivedOrder.objects.filter(
+        accept_datetime__isnull=False, due_datetime__isnull=True
+    )
+    minutes = accepted.order_by().values_list("time_to_deliver", flat=True)
+    for value in minutes.distinct():
+        accepted.filter(time_to_deliver=value).update(
+            due_datetime=models.ExpressionWrapper(
+                models.F("accept_datetime")
+                + models.Value(
+                    datetime.timedelta(minutes=value),
+                    output_field=models.DurationField(),
+                ),
+                output_field=models.DateTimeField(),
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_api', '0011_revoked_tokens'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_due_datetimes, migrations.RunPython.noop),
+    ]
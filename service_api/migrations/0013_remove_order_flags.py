@@ -0,0 +1,40 @@
+# Generated by Django 3.1.5 on 2026-10-18 15:20
+
+from django.db import migrations
+
+
+def fill_order_flags(apps, schema_editor):
+    Order = apps.get_model("service_api", "Order")
+    Order.objects.filter(status__in=["accepted", "delivered"]).update(
+        is_accepted=True
+    )
+    Order.objects.filter(status="delivered").update(is_delivered=True)
+    Order.objects.filter(status="cancelled").update(is_cancelled=True)
+
+
+class Migration(migrations.Migration):
+    """
+    Drop the order state flags which 0003 replaced with status, in its own
+    deploy once no running instance reads them anymore.
+    """
+
+    dependencies = [
+        ('service_api', '0012_archived_order_deadlines'),
+    ]
+
+    operations = [
+        # Restores the flags from status when migrating backwards.
+        migrations.RunPython(migrations.RunPython.noop, fill_order_flags),
+        migrations.RemoveField(
+            model_name='order',
+            name='is_accepted',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='is_cancelled',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='is_delivered',
+        ),
+    ]
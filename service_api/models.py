@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import RegexValidator, MinValueValidator
 
 
@@ -49,17 +50,236 @@ class Food(models.Model):
         return "<{}: {}$>".format(self.restaurant, self.name)
 
 
-class Order(models.Model):
+class BaseOrder(models.Model):
+    """
+    Fields and status helpers shared by live and archived orders.
+    """
+
+    PENDING = "pending"
+    ACCEPTED = "accepted"
+    CANCELLED = "cancelled"
+    DELIVERED = "delivered"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (ACCEPTED, "Accepted"),
+        (CANCELLED, "Cancelled"),
+        (DELIVERED, "Delivered"),
+    )
+    ACTIVE_STATUSES = (PENDING, ACCEPTED)
+    FINISHED_STATUSES = (CANCELLED, DELIVERED)
+
     customer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
-    foods = models.ManyToManyField(Food)
-    is_accepted = models.BooleanField(default=False, blank=False, null=False)
-    is_cancelled = models.BooleanField(default=False, blank=False, null=False)
-    is_delivered = models.BooleanField(default=False, blank=False, null=False)
+    restaurant = models.ForeignKey(
+        Restaurant, on_delete=models.RESTRICT, null=True, blank=True
+    )
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
     create_datetime = models.DateTimeField(auto_now_add=True, editable=False, blank=True)
     accept_datetime = models.DateTimeField(default=None, null=True, blank=True)
     cancell_datetime = models.DateTimeField(default=None, null=True, blank=True)
     delivered_datetime = models.DateTimeField(default=None, null=True, blank=True)
+    due_datetime = models.DateTimeField(default=None, null=True, blank=True)
+    overdue_datetime = models.DateTimeField(default=None, null=True, blank=True)
     note = models.CharField(max_length=1024, default="")
     time_to_deliver = models.IntegerField(
         validators=[MinValueValidator(1)], blank=False, null=False, default=30
     )
+
+    class Meta:
+        abstract = True
+
+    @property
+    def is_accepted(self):
+        return self.status in (self.ACCEPTED, self.DELIVERED)
+
+    @is_accepted.setter
+    def is_accepted(self, value):
+        self._set_status(self.ACCEPTED, value, previous=self.PENDING)
+
+    @property
+    def is_cancelled(self):
+        return self.status == self.CANCELLED
+
+    @is_cancelled.setter
+    def is_cancelled(self, value):
+        self._set_status(self.CANCELLED, value, previous=self.PENDING)
+
+    @property
+    def is_delivered(self):
+        return self.status == self.DELIVERED
+
+    @is_delivered.setter
+    def is_delivered(self, value):
+        self._set_status(self.DELIVERED, value, previous=self.ACCEPTED)
+
+    def _set_status(self, status, value, previous):
+        """
+        Move to status when value is true, or back to previous when the
+        order is in status and value is false.
+        """
+        if value:
+            self.status = status
+        elif self.status == status:
+            self.status = previous
+
+
+class BaseOrderItem(models.Model):
+    food = models.ForeignKey(Food, on_delete=models.RESTRICT)
+    quantity = models.PositiveIntegerField(
+        validators=[MinValueValidator(1)], blank=False, null=False, default=1
+    )
+    unit_price = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=False, null=False
+    )
+
+    class Meta:
+        abstract = True
+
+
+class Order(BaseOrder):
+    foods = models.ManyToManyField(Food, through="OrderItem")
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["customer", "status", "create_datetime"],
+                name="order_customer_status_idx",
+            ),
+            models.Index(
+                fields=["restaurant", "status", "create_datetime"],
+                name="order_restaurant_status_idx",
+            ),
+            models.Index(
+                fields=["restaurant", "create_datetime"],
+                name="order_restaurant_created_idx",
+            ),
+            models.Index(fields=["create_datetime"], name="order_created_idx"),
+            # Partial indexes of the accepted orders, by delivery deadline
+            models.Index(
+                fields=["restaurant", "due_datetime"],
+                name="order_restaurant_due_idx",
+                condition=models.Q(status=BaseOrder.ACCEPTED),
+            ),
+            models.Index(
+                fields=["due_datetime"],
+                name="order_unflagged_due_idx",
+                condition=models.Q(
+                    status=BaseOrder.ACCEPTED, overdue_datetime__isnull=True
+                ),
+            ),
+        ]
+
+
+class OrderItem(BaseOrderItem):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["order", "food"], name="orderitem_order_food_unique"
+            ),
+        ]
+
+
+class ArchivedOrder(BaseOrder):
+    """
+    Finished order moved out of the order table by archive_orders, it keeps
+    the primary key it had there.
+    """
+
+    id = models.IntegerField(primary_key=True)
+    create_datetime = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["customer", "status", "create_datetime"],
+                name="archivedorder_customer_idx",
+            ),
+            models.Index(
+                fields=["restaurant", "status", "create_datetime"],
+                name="archivedorder_restaurant_idx",
+            ),
+            models.Index(fields=["create_datetime"], name="archivedorder_created_idx"),
+        ]
+
+
+class ArchivedOrderItem(BaseOrderItem):
+    order = models.ForeignKey(
+        ArchivedOrder, on_delete=models.CASCADE, related_name="items"
+    )
+
+
+class RestaurantDailyStats(models.Model):
+    """
+    Order counts and revenue of a restaurant on one day.
+
+    Placements count on the day of the order, every other event on the day
+    it happened. Revenue and delivery times count delivered orders.
+    """
+
+    restaurant = models.ForeignKey(
+        Restaurant, on_delete=models.CASCADE, related_name="daily_stats"
+    )
+    day = models.DateField()
+    placed_orders = models.PositiveIntegerField(default=0)
+    accepted_orders = models.PositiveIntegerField(default=0)
+    cancelled_orders = models.PositiveIntegerField(default=0)
+    delivered_orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Sum and count of accept to deliver times, orders accepted before
+    # accept times were stored have none.
+    deliver_seconds = models.BigIntegerField(default=0)
+    timed_deliveries = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["restaurant", "day"], name="restaurantdailystats_unique"
+            ),
+        ]
+
+
+class Task(models.Model):
+    """
+    Background task waiting for the run_tasks worker: the function at the
+    dotted path is called with the payload as keyword arguments.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (FAILED, "Failed"),
+    )
+
+    path = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    create_datetime = models.DateTimeField(auto_now_add=True)
+    run_datetime = models.DateTimeField()
+    claim_datetime = models.DateTimeField(default=None, null=True, blank=True)
+    claimed_by = models.CharField(max_length=32, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_datetime"], name="task_status_run_idx"),
+            models.Index(fields=["claimed_by"], name="task_claimed_by_idx"),
+        ]
+
+    def __str__(self):
+        return "<{}: {}>".format(self.path, self.status)
+
+
+class RevokedToken(models.Model):
+    """
+    Id of a bearer token revoked by logging out, kept until the token would
+    have expired anyway.
+    """
+
+    jti = models.CharField(max_length=32, primary_key=True)
+    expire_datetime = models.DateTimeField(db_index=True)
@@ -0,0 +1,38 @@
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Paginate by primary key, so every page is a single indexed range query.
+    """
+
+    ordering = "id"
+    page_size_query_param = "page_size"
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class OrderCursorPagination(IdCursorPagination):
+    """
+    Paginate orders from the newest to the oldest one.
+    """
+
+    ordering = ("-create_datetime", "-id")
+
+
+class DueCursorPagination(IdCursorPagination):
+    """
+    Paginate orders from the earliest delivery deadline on.
+    """
+
+    ordering = ("due_datetime", "id")
+
+
+class SearchPagination(PageNumberPagination):
+    """
+    Paginate ranked search results, which have no stable cursor ordering.
+    """
+
+    page_size_query_param = "page_size"
+    max_page_size = settings.API_MAX_PAGE_SIZE
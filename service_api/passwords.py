@@ -0,0 +1,109 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2 hasher whose cost comes from the PASSWORD_HASH_ITERATIONS setting.
+
+    Hashes made with another iteration count are rehashed on the next
+    successful login.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many password checks in progress, try again later."
+    default_code = "hashing_busy"
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _submit(fn, *args):
+    """
+    Run fn in the password hashing pool and wait for its result.
+
+    At most PASSWORD_HASHING_WORKERS hashes run at once and at most
+    PASSWORD_HASHING_BACKLOG more wait for a worker, requests beyond that
+    are refused instead of queueing up behind them.
+    """
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING_WORKERS,
+                thread_name_prefix="password-hashing",
+            )
+            _slots = threading.BoundedSemaphore(
+                settings.PASSWORD_HASHING_WORKERS + settings.PASSWORD_HASHING_BACKLOG
+            )
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def _verify(password, encoded):
+    upgrade = []
+    valid = hashers.check_password(password, encoded, setter=upgrade.append)
+    return valid, hashers.make_password(password) if upgrade else None
+
+
+def hash_password(password):
+    """
+    Return the hash of password, computed in the hashing pool.
+    """
+    return _submit(hashers.make_password, password)
+
+
+def authenticate_user(username, password):
+    """
+    Return the active user with username and password, or None.
+
+    Only the hashing runs in the pool, the queries stay on the request's
+    connection. A hash made with outdated parameters is replaced in place.
+    """
+    user = User._default_manager.filter(username=username).first()
+    if user is None:
+        # Spend the same time as for an existing user, so usernames can
+        # not be found by timing the response.
+        hash_password(password)
+        return None
+    valid, upgraded = _submit(_verify, password, user.password)
+    if not valid or not user.is_active:
+        return None
+    if upgraded is not None:
+        user.password = upgraded
+        User._default_manager.filter(pk=user.pk).update(password=upgraded)
+    return user
+
+
+class PooledPasswordBackend(ModelBackend):
+    """
+    Model backend whose password checks run in the hashing pool, for the
+    logins going through django.contrib.auth.authenticate().
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        return authenticate_user(username, password)
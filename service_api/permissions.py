@@ -1,6 +1,20 @@
 from rest_framework import permissions
 
-from service_api.models import Restaurant, Food, Order
+from service_api.models import Restaurant
+
+
+def get_view_object(view):
+    """
+    Return the object of the view's pk from the view's queryset.
+
+    The object is fetched once and kept on the view, which lives for a
+    single request, so permission checks and the view itself share it.
+    """
+    if not hasattr(view, "_cached_object"):
+        view._cached_object = (
+            view.get_queryset().filter(pk=view.kwargs.get("pk", None)).first()
+        )
+    return view._cached_object
 
 
 class ManagerPermission(permissions.BasePermission):
@@ -11,6 +25,9 @@ class ManagerPermission(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.user.is_staff:
             return True
+        if hasattr(request.user, "is_manager"):
+            # Claim of a bearer token, no need to load the profile
+            return request.user.is_manager
         return request.user.profile.is_manager
 
 
@@ -33,13 +50,10 @@ class IsFoodOwner(permissions.BasePermission):
     message = "You are not the owner of this food restaurant"
 
     def has_permission(self, request, view):
-        food = Food.objects.filter(pk=view.kwargs.get("pk", None)).first()
+        food = get_view_object(view)
         if food is None:
             return False
-        return (
-            Restaurant.objects.filter(manager=request.user.pk).first()
-            == food.restaurant
-        )
+        return food.restaurant.manager_id == request.user.pk
 
 
 class CustomerCancellOrderPermission(permissions.BasePermission):
@@ -52,7 +66,7 @@ class CustomerCancellOrderPermission(permissions.BasePermission):
     )
 
     def has_permission(self, request, view):
-        order = Order.objects.filter(pk=view.kwargs.get("pk", None)).first()
+        order = get_view_object(view)
         if order is None:
             return False
         return not order.is_accepted and not order.is_cancelled
@@ -66,8 +80,10 @@ class IsCustomerOfOrder(permissions.BasePermission):
     message = "You can't cancell this order because you are not it's owner."
 
     def has_permission(self, request, view):
-        order = Order.objects.filter(customer=request.user.pk).first()
-        return order is not None
+        order = get_view_object(view)
+        if order is None:
+            return False
+        return order.customer_id == request.user.pk
 
 
 class CustomerApproveDeliveredOrderPermission(permissions.BasePermission):
@@ -78,7 +94,7 @@ class CustomerApproveDeliveredOrderPermission(permissions.BasePermission):
     message = "You can not approve this order as delivered."
 
     def has_permission(self, request, view):
-        order = Order.objects.filter(pk=view.kwargs.get("pk", None)).first()
+        order = get_view_object(view)
         if order is None:
             return False
         return order.is_accepted and not order.is_cancelled and not order.is_delivered
@@ -92,13 +108,10 @@ class IsManagerOfOrder(permissions.BasePermission):
     message = "You are not the manager of this order."
 
     def has_permission(self, request, view):
-        order = Order.objects.filter(pk=view.kwargs.get("pk", None)).first()
-        if order is None:
-            return False
-        food = order.foods.first()
-        if order is None or food is None:
+        order = get_view_object(view)
+        if order is None or order.restaurant is None:
             return False
-        return food.restaurant.manager.pk == request.user.pk
+        return order.restaurant.manager_id == request.user.pk
 
 
 class ManagerCancellAcceptOrderPermission(permissions.BasePermission):
@@ -109,7 +122,7 @@ class ManagerCancellAcceptOrderPermission(permissions.BasePermission):
     message = "You don't have permission to cancell this order."
 
     def has_permission(self, request, view):
-        order = Order.objects.filter(pk=view.kwargs.get("pk", None)).first()
+        order = get_view_object(view)
         if order is None:
             return False
         return not order.is_cancelled and not order.is_accepted
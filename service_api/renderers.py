@@ -0,0 +1,100 @@
+import abc
+import csv
+import datetime
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from rest_framework import renderers
+
+
+# Rows written to the response at once by the streaming renderers
+STREAM_BATCH_SIZE = 500
+
+
+def plain_text(value):
+    """
+    Flatten the lists and dicts of error details into one plain string.
+    """
+    if isinstance(value, dict):
+        return "; ".join(f"{key}: {plain_text(item)}" for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return "; ".join(plain_text(item) for item in value)
+    return str(value)
+
+
+class StreamingRenderer(renderers.BaseRenderer, metaclass=abc.ABCMeta):
+    """
+    Renderer of (fields, rows) exports which are streamed with stream().
+
+    render() only serves the error responses of the view, rows are never
+    collected into one body.
+    """
+
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if not isinstance(data, dict):
+            data = {"detail": data}
+        return "".join(self.lines(list(data), [list(data.values())])).encode()
+
+    def stream(self, fields, rows):
+        """
+        Yield the export in chunks of STREAM_BATCH_SIZE rows.
+        """
+        batch = []
+        for line in self.lines(fields, rows):
+            batch.append(line)
+            if len(batch) >= STREAM_BATCH_SIZE:
+                yield "".join(batch)
+                batch = []
+        if batch:
+            yield "".join(batch)
+
+    @abc.abstractmethod
+    def lines(self, fields, rows):
+        """
+        Yield the text lines of the fields header, if any, and of the rows.
+        """
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = {key: plain_text(value) for key, value in data.items()}
+        elif data is not None:
+            data = plain_text(data)
+        return super().render(data, accepted_media_type, renderer_context)
+
+    def lines(self, fields, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def line(values):
+            writer.writerow(values)
+            value = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return value
+
+        yield line(fields)
+        for row in rows:
+            yield line(
+                value.isoformat() if isinstance(value, datetime.datetime) else value
+                for value in row
+            )
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def lines(self, fields, rows):
+        for row in rows:
+            yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + "\n"
@@ -0,0 +1,123 @@
+import asyncio
+import contextlib
+import contextvars
+import random
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+PIN_KEY_PREFIX = "service_api:pin-primary:"
+
+_replica_reads = contextvars.ContextVar("replica_reads", default=False)
+_pinned = contextvars.ContextVar("pinned_to_primary", default=False)
+# Writes of the current request. The flag is mutated rather than set, so a
+# write made in a thread sync_to_async runs a view in is seen by the caller.
+_request_writes = contextvars.ContextVar("request_writes", default=None)
+
+
+class _Writes:
+    def __init__(self):
+        self.wrote = False
+
+
+def pin_key(user_id):
+    return PIN_KEY_PREFIX + str(user_id)
+
+
+def is_pinned(user):
+    """
+    Return whether user wrote recently enough for replicas to lag behind.
+    """
+    return user.is_authenticated and bool(cache.get(pin_key(user.pk)))
+
+
+@contextlib.contextmanager
+def read_from_replicas(user):
+    """
+    Send the reads of the block to a replica, unless user is pinned to the
+    primary or the block writes, after which it reads from the primary too.
+    """
+    if is_pinned(user):
+        yield
+        return
+    reads = _replica_reads.set(True)
+    pinned = _pinned.set(False)
+    try:
+        yield
+    finally:
+        _pinned.reset(pinned)
+        _replica_reads.reset(reads)
+
+
+class ReplicaRouter:
+    """
+    Route reads inside read_from_replicas to a random replica from
+    DATABASE_REPLICAS, everything else goes to the primary.
+
+    Replicas get their schema and rows through replication, so nothing is
+    migrated on them.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and not _pinned.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        writes = _request_writes.get()
+        if writes is not None:
+            writes.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class PrimaryPinMiddleware:
+    """
+    Pin users to the primary for REPLICA_PIN_SECONDS after a request of
+    theirs wrote, so their next requests do not miss their own change.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells the handler this middleware is called as a coroutine.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        writes = _Writes()
+        token = _request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_writes.reset(token)
+        self.pin(request, writes)
+        return response
+
+    async def __acall__(self, request):
+        writes = _Writes()
+        token = _request_writes.set(writes)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_writes.reset(token)
+        # request.user may still be a lazy object which loads the user.
+        await sync_to_async(self.pin, thread_sensitive=True)(request, writes)
+        return response
+
+    def pin(self, request, writes):
+        user = getattr(request, "user", None)
+        if writes.wrote and user is not None and user.is_authenticated:
+            cache.set(pin_key(user.pk), True, settings.REPLICA_PIN_SECONDS)
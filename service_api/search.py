@@ -0,0 +1,379 @@
+import re
+import threading
+from bisect import bisect_left, bisect_right
+
+from django.db import connection
+from django.db.models import F, Q
+
+from service_api.cache import get_catalogue_version
+from service_api.models import Restaurant, Food
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def seconds_of(time):
+    return time.hour * 3600 + time.minute * 60 + time.second
+
+
+def opening_intervals(open_time, close_time):
+    """
+    Return the [start, end) second intervals of a day a restaurant is open.
+
+    Windows crossing midnight are split in two, and a restaurant which
+    closes at the time it opens is open all day.
+    """
+    start, end = seconds_of(open_time), seconds_of(close_time)
+    if start < end:
+        return [(start, end)]
+    if start == end:
+        return [(0, SECONDS_PER_DAY)]
+    intervals = [(start, SECONDS_PER_DAY)]
+    if end:
+        intervals.append((0, end))
+    return intervals
+
+
+def open_at_q(time):
+    """
+    ORM condition equivalent to RestaurantIndex's opening hours lookup.
+    """
+    same_day = Q(
+        open_time__lt=F("close_time"), open_time__lte=time, close_time__gt=time
+    )
+    over_midnight = Q(open_time__gt=F("close_time")) & (
+        Q(open_time__lte=time) | Q(close_time__gt=time)
+    )
+    all_day = Q(open_time=F("close_time"))
+    return same_day | over_midnight | all_day
+
+
+def normalize(value):
+    return value.strip().casefold()
+
+
+class _Bucket:
+    """
+    Restaurants of one city and food type.
+
+    The day is cut into segments at every opening and closing second of
+    the bucket, and a sweep over those bounds stores the restaurants open
+    during each segment. A lookup bisects the bounds, and the segments are
+    swept again on the first lookup after a change.
+    """
+
+    def __init__(self):
+        self.intervals = {}
+        self.pks = set()
+        self.bounds = None
+        self.segments = None
+
+    def add(self, pk, intervals):
+        self.pks.add(pk)
+        self.intervals[pk] = intervals
+        self.bounds = None
+
+    def remove(self, pk):
+        self.pks.discard(pk)
+        self.intervals.pop(pk, None)
+        self.bounds = None
+
+    def _sweep(self):
+        changes = {}
+        for pk, intervals in self.intervals.items():
+            for start, end in intervals:
+                changes.setdefault(start, []).append((pk, True))
+                changes.setdefault(end, []).append((pk, False))
+        bounds, segments, open_pks = [], [], set()
+        for second in sorted(changes):
+            for pk, opens in changes[second]:
+                if opens:
+                    open_pks.add(pk)
+                else:
+                    open_pks.discard(pk)
+            bounds.append(second)
+            segments.append(frozenset(open_pks))
+        self.bounds, self.segments = bounds, segments
+
+    def open_at(self, second):
+        if self.bounds is None:
+            self._sweep()
+        # Segment i covers [bounds[i], bounds[i + 1]).
+        index = bisect_right(self.bounds, second) - 1
+        return self.segments[index] if index >= 0 else frozenset()
+
+
+class RestaurantIndex:
+    """
+    In-process index of restaurants by city, food type and opening hours.
+
+    The index is built lazily from the database and updated incrementally
+    by the restaurant signals. It remembers the catalogue version it
+    reflects, and is rebuilt when another process changed the catalogue.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._buckets = {}
+        self._entries = {}
+
+    def search(self, city=None, food_type=None, at=None):
+        """
+        Return the sorted primary keys of the matching restaurants.
+        """
+        with self._lock:
+            if self._version != get_catalogue_version():
+                self._build()
+            buckets = self._matching_buckets(city, food_type)
+            pks = set()
+            for bucket in buckets:
+                if at is None:
+                    pks |= bucket.pks
+                else:
+                    pks |= bucket.open_at(seconds_of(at))
+        return sorted(pks)
+
+    def update(self, restaurant, version):
+        """
+        Apply a saved restaurant, which moved the catalogue to version.
+        """
+        with self._lock:
+            if not self._applies(version):
+                return
+            self._remove(restaurant.pk)
+            self._add(
+                restaurant.pk,
+                restaurant.city,
+                restaurant.food_type,
+                restaurant.open_time,
+                restaurant.close_time,
+            )
+
+    def delete(self, pk, version):
+        with self._lock:
+            if self._applies(version):
+                self._remove(pk)
+
+    def _applies(self, version):
+        # An incremental change is only safe on top of the version right
+        # before it, otherwise the index waits for a rebuild.
+        if self._version is None or self._version + 1 != version:
+            self._version = None
+            return False
+        self._version = version
+        return True
+
+    def _matching_buckets(self, city, food_type):
+        city = None if city is None else normalize(city)
+        food_type = None if food_type is None else normalize(food_type)
+        if city is not None and food_type is not None:
+            bucket = self._buckets.get((city, food_type))
+            return [bucket] if bucket is not None else []
+        return [
+            bucket
+            for (bucket_city, bucket_food_type), bucket in self._buckets.items()
+            if city in (None, bucket_city) and food_type in (None, bucket_food_type)
+        ]
+
+    def _build(self):
+        version = get_catalogue_version()
+        self._buckets = {}
+        self._entries = {}
+        restaurants = Restaurant.objects.values_list(
+            "pk", "city", "food_type", "open_time", "close_time"
+        )
+        for row in restaurants.iterator(chunk_size=2000):
+            self._add(*row)
+        self._version = version
+
+    def _add(self, pk, city, food_type, open_time, close_time):
+        key = (normalize(city), normalize(food_type))
+        intervals = opening_intervals(open_time, close_time)
+        self._buckets.setdefault(key, _Bucket()).add(pk, intervals)
+        self._entries[pk] = key
+
+    def _remove(self, pk):
+        key = self._entries.pop(pk, None)
+        if key is None:
+            return
+        bucket = self._buckets[key]
+        bucket.remove(pk)
+        if not bucket.pks:
+            del self._buckets[key]
+
+
+restaurant_index = RestaurantIndex()
+
+
+class RestaurantSearchResults:
+    """
+    Restaurants of the sorted primary keys returned by the index, read as a
+    queryset by the id cursor pagination.
+
+    Cursor filters and slices only move bounds over the primary keys, so
+    just the restaurants of the requested page are loaded.
+    """
+
+    def __init__(self, pks, low=0, high=None, reverse=False):
+        self.pks = pks
+        self.low = low
+        self.high = len(pks) if high is None else high
+        self.reverse = reverse
+
+    def order_by(self, *fields):
+        if fields not in (("id",), ("-id",)):
+            raise TypeError("Search results can only be ordered by id.")
+        return RestaurantSearchResults(
+            self.pks, self.low, self.high, reverse=fields[0] == "-id"
+        )
+
+    def filter(self, id__gt=None, id__lt=None):
+        low, high = self.low, self.high
+        if id__gt is not None:
+            low = max(low, bisect_right(self.pks, int(id__gt), low, high))
+        if id__lt is not None:
+            high = min(high, bisect_left(self.pks, int(id__lt), low, high))
+        return RestaurantSearchResults(self.pks, low, high, self.reverse)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError("Search results only support slicing.")
+        start, stop, _ = index.indices(self.high - self.low)
+        if self.reverse:
+            pks = self.pks[self.high - stop : self.high - start][::-1]
+        else:
+            pks = self.pks[self.low + start : self.low + stop]
+        restaurants = Restaurant.objects.in_bulk(pks)
+        return [restaurants[pk] for pk in pks if pk in restaurants]
+
+
+FOOD_SEARCH_TABLE = "service_api_food_fts"
+
+FOOD_SEARCH_TRIGGERS = [
+    "food_insert",
+    "food_update",
+    "food_delete",
+    "restaurant_update",
+]
+
+FOOD_SEARCH_SQL = [
+    "CREATE VIRTUAL TABLE {table} USING fts5(name, restaurant_name, food_type)",
+    """
+    CREATE TRIGGER {table}_food_insert
+    AFTER INSERT ON service_api_food BEGIN
+        INSERT INTO {table} (rowid, name, restaurant_name, food_type)
+        SELECT new.id, new.name, r.name, r.food_type
+        FROM service_api_restaurant r WHERE r.id = new.restaurant_id;
+    END
+    """,
+    """
+    CREATE TRIGGER {table}_food_update
+    AFTER UPDATE OF name, restaurant_id ON service_api_food BEGIN
+        DELETE FROM {table} WHERE rowid = old.id;
+        INSERT INTO {table} (rowid, name, restaurant_name, food_type)
+        SELECT new.id, new.name, r.name, r.food_type
+        FROM service_api_restaurant r WHERE r.id = new.restaurant_id;
+    END
+    """,
+    """
+    CREATE TRIGGER {table}_food_delete
+    AFTER DELETE ON service_api_food BEGIN
+        DELETE FROM {table} WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER {table}_restaurant_update
+    AFTER UPDATE OF name, food_type ON service_api_restaurant BEGIN
+        UPDATE {table} SET restaurant_name = new.name, food_type = new.food_type
+        WHERE rowid IN (
+            SELECT id FROM service_api_food WHERE restaurant_id = new.id
+        );
+    END
+    """,
+    """
+    INSERT INTO {table} (rowid, name, restaurant_name, food_type)
+    SELECT f.id, f.name, r.name, r.food_type
+    FROM service_api_food f
+    JOIN service_api_restaurant r ON r.id = f.restaurant_id
+    """,
+]
+
+
+def uninstall_food_search(connection):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for trigger in FOOD_SEARCH_TRIGGERS:
+            cursor.execute(
+                "DROP TRIGGER IF EXISTS {}_{}".format(FOOD_SEARCH_TABLE, trigger)
+            )
+        cursor.execute("DROP TABLE IF EXISTS {}".format(FOOD_SEARCH_TABLE))
+
+
+def install_food_search(connection):
+    """
+    (Re)create the SQLite FTS5 dish index with its sync triggers and fill
+    it from the food table in one INSERT ... SELECT.
+
+    Rebuilding a table in a SQLite migration drops its triggers, so this
+    must run again after any migration which rebuilds the food or
+    restaurant tables.
+    """
+    if connection.vendor != "sqlite":
+        return
+    uninstall_food_search(connection)
+    with connection.cursor() as cursor:
+        for sql in FOOD_SEARCH_SQL:
+            cursor.execute(sql.format(table=FOOD_SEARCH_TABLE))
+
+
+def match_expression(text):
+    """
+    Turn free text into an FTS5 query matching every word as a prefix.
+    """
+    words = re.findall(r"\w+", text)
+    return " ".join('"{}"*'.format(word) for word in words)
+
+
+class FoodSearchResults:
+    """
+    Lazily evaluated, rank ordered foods matching a search text.
+
+    Counting and slicing run their own queries, so a paginator only loads
+    the foods of the requested page.
+    """
+
+    # bm25 weights of the name, restaurant_name and food_type columns
+    RANK = "bm25({table}, 10.0, 2.0, 1.0)".format(table=FOOD_SEARCH_TABLE)
+
+    def __init__(self, text):
+        self.match = match_expression(text)
+
+    def count(self):
+        if not self.match:
+            return 0
+        sql = "SELECT COUNT(*) FROM {table} WHERE {table} MATCH %s"
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(table=FOOD_SEARCH_TABLE), [self.match])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError("FoodSearchResults only support slicing.")
+        start = index.start or 0
+        limit = -1 if index.stop is None else max(index.stop - start, 0)
+        if not self.match or limit == 0:
+            return []
+        sql = (
+            "SELECT rowid FROM {table} WHERE {table} MATCH %s "
+            "ORDER BY {rank} LIMIT %s OFFSET %s"
+        ).format(table=FOOD_SEARCH_TABLE, rank=self.RANK)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.match, limit, start])
+            pks = [row[0] for row in cursor.fetchall()]
+        foods = Food.objects.in_bulk(pks)
+        return [foods[pk] for pk in pks if pk in foods]
@@ -1,7 +1,100 @@
+import datetime
+from decimal import Decimal
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 
-from service_api.models import Profile, Restaurant, Food, Order
+from service_api.models import (
+    Profile,
+    Restaurant,
+    Food,
+    Order,
+    OrderItem,
+    RestaurantDailyStats,
+)
+from service_api.passwords import hash_password
+from service_api.stats import record_placed
+
+
+# Smallest total which does not fit Order.total
+MAX_ORDER_TOTAL = Decimal(10) ** (
+    Order._meta.get_field("total").max_digits
+    - Order._meta.get_field("total").decimal_places
+)
+
+
+def count_quantities(foods, items):
+    """
+    Merge ordered food ids, each counting once, and order items into
+    quantities per food id.
+    """
+    quantities = {}
+    for food_id in foods:
+        quantities[food_id] = quantities.get(food_id, 0) + 1
+    for item in items:
+        food_id = item["food_id"]
+        quantities[food_id] = quantities.get(food_id, 0) + item["quantity"]
+    return quantities
+
+
+def price_order(quantities, foods):
+    """
+    Return (restaurant_id, items, total) of an order, with the unit price
+    of each item taken from foods, a mapping of the loaded foods by id.
+    """
+    if not quantities:
+        raise serializers.ValidationError({"foods": ["Order at least one food."]})
+    for food_id in quantities:
+        if food_id not in foods:
+            raise serializers.ValidationError(
+                {"foods": ["Invalid pk {} - object does not exist.".format(food_id)]}
+            )
+    restaurant_ids = {foods[food_id].restaurant_id for food_id in quantities}
+    if len(restaurant_ids) != 1:
+        raise serializers.ValidationError(
+            "All ordered foods should be from one restaurant."
+        )
+    if max(quantities.values()) > settings.ORDER_MAX_QUANTITY:
+        raise serializers.ValidationError(
+            {
+                "items": [
+                    "Order at most {} of a food.".format(settings.ORDER_MAX_QUANTITY)
+                ]
+            }
+        )
+    items = [
+        OrderItem(food_id=food_id, quantity=quantity, unit_price=foods[food_id].price)
+        for food_id, quantity in quantities.items()
+    ]
+    total = sum(item.unit_price * item.quantity for item in items)
+    if total >= MAX_ORDER_TOTAL:
+        raise serializers.ValidationError("The order total is too large.")
+    return restaurant_ids.pop(), items, total
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def load_foods(food_ids):
+    return Food.objects.only("id", "restaurant_id", "price").in_bulk(food_ids)
+
+
+class TransitionFlagField(serializers.BooleanField):
+    """
+    Boolean flag of an order state transition, which can only be set.
+    """
+
+    default_error_messages = {"unset": "Order state transitions can not be undone."}
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not value:
+            self.fail("unset")
+        return value
 
 
 class LoginSerializer(serializers.ModelSerializer):
@@ -71,9 +164,8 @@ class UserSerializer(serializers.ModelSerializer):
             username=validated_data["username"],
             first_name=validated_data["first_name"],
             last_name=validated_data["last_name"],
+            password=hash_password(validated_data["password"]),
         )
-        user.set_password(validated_data["password"])
-        user.save()
         Profile.objects.create(user=user, **profile_data)
         return user
 
@@ -84,7 +176,8 @@ class UserSerializer(serializers.ModelSerializer):
         instance.username = validated_data.get("username", instance.username)
         instance.first_name = validated_data.get("first_name", instance.first_name)
         instance.last_name = validated_data.get("last_name", instance.last_name)
-        instance.set_password(validated_data.get("password"))
+        if "password" in validated_data:
+            instance.password = hash_password(validated_data["password"])
 
         profile.birth_date = profile_data.get("birth_date", profile.birth_date)
         profile.gender = profile_data.get("gender", profile.gender)
@@ -119,48 +212,226 @@ class FoodSerializer(serializers.ModelSerializer):
         extra_kwargs = {"restaurant": {"read_only": True}}
 
 
+class RestaurantSearchSerializer(serializers.Serializer):
+    city = serializers.CharField(required=False)
+    food_type = serializers.CharField(required=False)
+    open_now = serializers.BooleanField(required=False)
+    open_at = serializers.TimeField(required=False)
+
+
+class FoodSearchSerializer(serializers.Serializer):
+    q = serializers.CharField()
+
+
+class MenuFilterSerializer(serializers.Serializer):
+    is_vegan = serializers.BooleanField(required=False)
+    is_organic = serializers.BooleanField(required=False)
+    min_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, required=False
+    )
+    max_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, required=False
+    )
+
+    def filter(self, menu):
+        """
+        Return the serialized foods of menu which match the filters.
+        """
+        filters = self.validated_data
+        foods = []
+        for food in menu:
+            if any(
+                name in filters and food[name] != filters[name]
+                for name in ("is_vegan", "is_organic")
+            ):
+                continue
+            price = Decimal(food["price"])
+            if "min_price" in filters and price < filters["min_price"]:
+                continue
+            if "max_price" in filters and price > filters["max_price"]:
+                continue
+            foods.append(food)
+        return foods
+
+
+class StatsRangeSerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        end = data.get("end") or timezone.localdate()
+        start = data.get("start") or end - datetime.timedelta(days=29)
+        if start > end:
+            raise serializers.ValidationError("start should not be after end.")
+        if (end - start).days >= settings.STATS_MAX_DAYS:
+            raise serializers.ValidationError(
+                "At most {} days can be requested.".format(settings.STATS_MAX_DAYS)
+            )
+        return {"start": start, "end": end}
+
+
+class ExportFilterSerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+
+    def filter(self, orders):
+        """
+        Return the orders placed from start through end in the given status.
+        """
+        filters = self.validated_data
+        if "start" in filters:
+            orders = orders.filter(create_datetime__gte=start_of_day(filters["start"]))
+        if "end" in filters:
+            end = filters["end"] + datetime.timedelta(days=1)
+            orders = orders.filter(create_datetime__lt=start_of_day(end))
+        if "status" in filters:
+            orders = orders.filter(status=filters["status"])
+        return orders
+
+
+class RestaurantDailyStatsSerializer(serializers.ModelSerializer):
+    cancellation_rate = serializers.SerializerMethodField()
+    average_deliver_minutes = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RestaurantDailyStats
+        fields = (
+            "day",
+            "placed_orders",
+            "accepted_orders",
+            "cancelled_orders",
+            "delivered_orders",
+            "revenue",
+            "cancellation_rate",
+            "average_deliver_minutes",
+        )
+
+    def get_cancellation_rate(self, obj):
+        if not obj.placed_orders:
+            return None
+        return round(obj.cancelled_orders / obj.placed_orders, 4)
+
+    def get_average_deliver_minutes(self, obj):
+        if not obj.timed_deliveries:
+            return None
+        return round(obj.deliver_seconds / obj.timed_deliveries / 60, 1)
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    food = serializers.IntegerField(source="food_id", min_value=1)
+    quantity = serializers.IntegerField(
+        min_value=1, max_value=settings.ORDER_MAX_QUANTITY, default=1
+    )
+
+    class Meta:
+        model = OrderItem
+        fields = ("food", "quantity", "unit_price")
+        extra_kwargs = {"unit_price": {"read_only": True}}
+
+
 class PlaceOrderSerializer(serializers.ModelSerializer):
+    is_accepted = serializers.BooleanField(read_only=True)
+    is_cancelled = serializers.BooleanField(read_only=True)
+    is_delivered = serializers.BooleanField(read_only=True)
+    foods = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, write_only=True
+    )
+    items = OrderItemSerializer(many=True, required=False)
+
     class Meta:
         model = Order
         fields = "__all__"
         extra_kwargs = {
             "customer": {"read_only": True},
-            "is_accepted": {"read_only": True},
-            "is_cancelled": {"read_only": True},
-            "is_delivered": {"read_only": True},
+            "restaurant": {"read_only": True},
+            "total": {"read_only": True},
+            "status": {"read_only": True},
             "accept_datetime": {"read_only": True},
             "cancell_datetime": {"read_only": True},
             "delivered_datetime": {"read_only": True},
+            "due_datetime": {"read_only": True},
+            "overdue_datetime": {"read_only": True},
             "time_to_deliver": {"read_only": True},
         }
 
     def validate(self, data):
         """
-        Check all ordered foods to be from one restaurants.
+        Check all ordered foods to exist and be from one restaurant, and
+        price the order.
         """
-        food_list = data["foods"]
-        restaurant_id = food_list[0].restaurant.pk
-        for food in food_list:
-            if food.restaurant.pk != restaurant_id:
-                raise serializers.ValidationError(
-                    "All ordered foods should be from one restaurant."
-                )
+        quantities = count_quantities(data.pop("foods", []), data.pop("items", []))
+        restaurant_id, items, total = price_order(
+            quantities, load_foods(list(quantities))
+        )
+        data.update(restaurant_id=restaurant_id, items=items, total=total)
+        return data
+
+    def create(self, validated_data):
+        items = validated_data.pop("items")
+        with transaction.atomic():
+            order = Order.objects.create(**validated_data)
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
+            record_placed([order])
+        return order
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["foods"] = [item["food"] for item in data["items"]]
         return data
 
 
 class CancellOrderSerializer(serializers.ModelSerializer):
+    is_cancelled = TransitionFlagField(required=False)
+
     class Meta:
         model = Order
         fields = ("is_cancelled",)
 
 
 class ApproveDeliveredOrderSerializer(serializers.ModelSerializer):
+    is_delivered = TransitionFlagField(required=False)
+
     class Meta:
         model = Order
         fields = ("is_delivered",)
 
 
 class AcceptOrderSerializer(serializers.ModelSerializer):
+    is_accepted = TransitionFlagField(required=False)
+
     class Meta:
         model = Order
         fields = ("is_accepted", "time_to_deliver",)
+        extra_kwargs = {
+            "time_to_deliver": {"max_value": settings.ORDER_MAX_TIME_TO_DELIVER}
+        }
+
+
+class BulkOrderItemSerializer(serializers.Serializer):
+    foods = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), default=list
+    )
+    items = OrderItemSerializer(many=True, default=list)
+    note = serializers.CharField(max_length=1024, allow_blank=True, default="")
+
+
+class BulkPlaceOrderSerializer(serializers.Serializer):
+    orders = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_ITEMS,
+    )
+
+
+class BulkAcceptOrderSerializer(serializers.Serializer):
+    orders = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_ITEMS,
+    )
+    time_to_deliver = serializers.IntegerField(
+        min_value=1, max_value=settings.ORDER_MAX_TIME_TO_DELIVER, required=False
+    )
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from service_api.cache import bump_catalogue_version, invalidate_menu
+from service_api.metrics import count_queries
+from service_api.models import Restaurant, Food
+from service_api.search import restaurant_index
+
+
+@receiver(post_save, sender=Restaurant)
+def restaurant_saved(sender, instance, **kwargs):
+    def saved():
+        version = bump_catalogue_version()
+        restaurant_index.update(instance, version)
+        invalidate_menu(instance.pk)
+
+    # Before the change commits, another request could cache the old rows
+    # again under the new catalogue version.
+    transaction.on_commit(saved)
+
+
+@receiver(post_delete, sender=Restaurant)
+def restaurant_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+
+    def deleted():
+        version = bump_catalogue_version()
+        restaurant_index.delete(pk, version)
+        invalidate_menu(pk)
+
+    transaction.on_commit(deleted)
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+def food_changed(sender, instance, **kwargs):
+    restaurant_id = instance.restaurant_id
+    transaction.on_commit(lambda: invalidate_menu(restaurant_id))
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    # First, so the wrappers execute_wrapper() pushes and pops stay on top.
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute("PRAGMA {} = {}".format(name, value))
@@ -0,0 +1,196 @@
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from service_api.models import Order, RestaurantDailyStats
+
+
+# Rollup field counting the orders moved into each status
+TRANSITION_FIELDS = {
+    Order.ACCEPTED: "accepted_orders",
+    Order.CANCELLED: "cancelled_orders",
+    Order.DELIVERED: "delivered_orders",
+}
+
+# Rollup fields which add up over several days
+STATS_SUM_FIELDS = (
+    "placed_orders",
+    "accepted_orders",
+    "cancelled_orders",
+    "delivered_orders",
+    "revenue",
+    "deliver_seconds",
+    "timed_deliveries",
+)
+
+
+def record(restaurant_id, day, **increments):
+    """
+    Add increments to the rollup of the restaurant's day, creating it on
+    the first event of the day.
+    """
+    rollups = RestaurantDailyStats.objects.filter(
+        restaurant_id=restaurant_id, day=day
+    )
+    updates = {name: F(name) + value for name, value in increments.items()}
+    if rollups.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            RestaurantDailyStats.objects.create(
+                restaurant_id=restaurant_id, day=day, **increments
+            )
+    except IntegrityError:
+        # Another request created the day first.
+        rollups.update(**updates)
+
+
+def record_placed(orders):
+    """
+    Count newly placed orders in the rollups of their days.
+    """
+    placed = Counter(
+        (order.restaurant_id, timezone.localdate(order.create_datetime))
+        for order in orders
+        if order.restaurant_id is not None
+    )
+    for (restaurant_id, day), count in placed.items():
+        record(restaurant_id, day, placed_orders=count)
+
+
+def _transition_increments(order, target_status, at):
+    increments = {TRANSITION_FIELDS[target_status]: 1}
+    if target_status == Order.DELIVERED:
+        increments["revenue"] = order.total
+        if order.accept_datetime is not None:
+            increments["deliver_seconds"] = int(
+                (at - order.accept_datetime).total_seconds()
+            )
+            increments["timed_deliveries"] = 1
+    return increments
+
+
+def record_transition(order, target_status, at):
+    """
+    Count the move of order into target_status which happened at.
+
+    The order must still carry the fields it had before the move.
+    """
+    if order.restaurant_id is not None:
+        increments = _transition_increments(order, target_status, at)
+        record(order.restaurant_id, timezone.localdate(at), **increments)
+
+
+def record_transitions(orders, target_status, at):
+    """
+    Count the move of several orders into target_status at the same time,
+    with one rollup update per restaurant.
+    """
+    per_restaurant = defaultdict(Counter)
+    for order in orders:
+        if order.restaurant_id is not None:
+            per_restaurant[order.restaurant_id].update(
+                _transition_increments(order, target_status, at)
+            )
+    for restaurant_id, increments in per_restaurant.items():
+        record(restaurant_id, timezone.localdate(at), **increments)
+
+
+def rebuild_stats(order_model, stats_model, restaurant_ids, archive_model=None):
+    """
+    Recompute the rollups of restaurant_ids from their orders, and from
+    their archived orders when archive_model is given.
+
+    The models are passed in so migrations can use their historical
+    versions.
+    """
+    rows = defaultdict(dict)
+
+    def add(queryset, datetime_field, **aggregates):
+        # Orders finished before transition times were stored count on the
+        # day they were placed.
+        grouped = (
+            queryset.annotate(
+                day=TruncDate(Coalesce(datetime_field, "create_datetime"))
+            )
+            .values("restaurant_id", "day")
+            .annotate(**aggregates)
+            .order_by()
+        )
+        for row in grouped:
+            totals = rows[(row.pop("restaurant_id"), row.pop("day"))]
+            for name, value in row.items():
+                if value is not None:
+                    totals[name] = totals[name] + value if name in totals else value
+
+    for model in (order_model, archive_model):
+        if model is None:
+            continue
+        orders = model.objects.filter(restaurant_id__in=restaurant_ids)
+        add(orders, "create_datetime", placed_orders=Count("pk"))
+        add(
+            orders.filter(status__in=(Order.ACCEPTED, Order.DELIVERED)),
+            "accept_datetime",
+            accepted_orders=Count("pk"),
+        )
+        add(
+            orders.filter(status=Order.CANCELLED),
+            "cancell_datetime",
+            cancelled_orders=Count("pk"),
+        )
+        add(
+            orders.filter(status=Order.DELIVERED),
+            "delivered_datetime",
+            delivered_orders=Count("pk"),
+            revenue=Sum("total"),
+            deliver_time=Sum(
+                ExpressionWrapper(
+                    F("delivered_datetime") - F("accept_datetime"),
+                    output_field=DurationField(),
+                )
+            ),
+            timed_deliveries=Count(
+                "pk",
+                filter=Q(
+                    accept_datetime__isnull=False, delivered_datetime__isnull=False
+                ),
+            ),
+        )
+
+    rollups = []
+    for (restaurant_id, day), row in rows.items():
+        deliver_time = row.pop("deliver_time", None)
+        if deliver_time is not None:
+            row["deliver_seconds"] = int(deliver_time.total_seconds())
+        row["revenue"] = row.get("revenue") or Decimal("0")
+        rollups.append(stats_model(restaurant_id=restaurant_id, day=day, **row))
+
+    with transaction.atomic():
+        stats_model.objects.filter(restaurant_id__in=restaurant_ids).delete()
+        stats_model.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def rebuild_all_stats(
+    restaurant_model, order_model, stats_model, chunk_size, archive_model=None
+):
+    """
+    Rebuild the rollups of every restaurant, chunk_size restaurants at a
+    time, and return the number of rollups written.
+    """
+    written = 0
+    last_pk = 0
+    while True:
+        chunk = list(
+            restaurant_model.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:chunk_size]
+        )
+        if not chunk:
+            return written
+        written += rebuild_stats(order_model, stats_model, chunk, archive_model)
+        last_pk = chunk[-1]
@@ -0,0 +1,112 @@
+import datetime
+import logging
+import traceback
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from service_api.models import Task
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(path, **payload):
+    """
+    Queue a call of the function at the dotted path with payload once the
+    current transaction commits, nothing is queued if it rolls back.
+    """
+    transaction.on_commit(
+        lambda: Task.objects.create(
+            path=path, payload=payload, run_datetime=timezone.now()
+        )
+    )
+
+
+def _due(now):
+    lease = now - datetime.timedelta(seconds=settings.TASK_LEASE_SECONDS)
+    return Q(status=Task.QUEUED, run_datetime__lte=now) | Q(
+        status=Task.RUNNING, claim_datetime__lt=lease
+    )
+
+
+def claim_tasks(limit):
+    """
+    Claim up to limit due tasks, oldest first, and return their primary
+    keys. Tasks whose worker died while running them are due again.
+
+    The claim is a conditional UPDATE, so two workers never claim the same
+    task.
+    """
+    now = timezone.now()
+    due = Task.objects.filter(_due(now))
+    pks = list(due.order_by("run_datetime").values_list("pk", flat=True)[:limit])
+    if not pks:
+        return []
+    claim = uuid.uuid4().hex
+    due.filter(pk__in=pks).update(
+        status=Task.RUNNING,
+        claimed_by=claim,
+        claim_datetime=now,
+        attempts=F("attempts") + 1,
+    )
+    return list(Task.objects.filter(claimed_by=claim).values_list("pk", flat=True))
+
+
+def run_task(pk):
+    """
+    Run a claimed task and return whether it succeeded, or None when the
+    task is gone.
+
+    A task which succeeds is deleted. One which raises is run again after
+    a delay doubling with every attempt, until TASK_MAX_ATTEMPTS runs
+    failed and it is kept as failed.
+    """
+    try:
+        task = Task.objects.get(pk=pk)
+    except Task.DoesNotExist:
+        # Another worker claimed the task again once its lease expired and
+        # already finished it.
+        logger.warning("Task %s was lost to another worker", pk)
+        return None
+    claimed = Task.objects.filter(pk=pk, claimed_by=task.claimed_by)
+    try:
+        import_string(task.path)(**task.payload)
+    except Exception:
+        logger.exception("Task %s %s failed", task.pk, task.path)
+        error = traceback.format_exc()
+        if task.attempts >= settings.TASK_MAX_ATTEMPTS:
+            claimed.update(status=Task.FAILED, last_error=error)
+        else:
+            delay = settings.TASK_RETRY_DELAY * 2 ** (task.attempts - 1)
+            claimed.update(
+                status=Task.QUEUED,
+                run_datetime=timezone.now() + datetime.timedelta(seconds=delay),
+                last_error=error,
+            )
+        return False
+    claimed.delete()
+    return True
+
+
+def queue_gauges():
+    """
+    Return (name, help text, value) of the queue depth and lag metrics.
+    """
+    now = timezone.now()
+    queue = Task.objects.aggregate(
+        queued=Count("pk", filter=Q(status=Task.QUEUED)),
+        running=Count("pk", filter=Q(status=Task.RUNNING)),
+        failed=Count("pk", filter=Q(status=Task.FAILED)),
+        oldest=Min("run_datetime", filter=_due(now)),
+    )
+    lag = (now - queue["oldest"]).total_seconds() if queue["oldest"] else 0
+    return (
+        ("task_queue_depth", "Tasks waiting to run.", queue["queued"]),
+        ("task_running", "Tasks claimed by a worker.", queue["running"]),
+        ("task_failed", "Tasks which failed every attempt.", queue["failed"]),
+        ("task_queue_lag_seconds", "Time the oldest due task has waited.", lag),
+    )
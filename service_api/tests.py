@@ -1,3 +1,1620 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import Min, Sum
+from django.test import (
+    AsyncClient,
+    Client,
+    TestCase,
+    TransactionTestCase,
+)
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from service_api.authentication import issue_token, read_token, revoke_token
+from service_api.cache import CATALOGUE_CHANGED_KEY, CATALOGUE_VERSION_KEY
+from service_api.deadlines import DeadlineScheduler
+from service_api.export import EXPORT_FIELDS
+from service_api.events import (
+    ORDER_CREATED,
+    get_event_hub,
+    order_events_application,
+)
+from service_api.metrics import Histogram, registry
+from service_api.models import (
+    Profile,
+    Restaurant,
+    Food,
+    Order,
+    OrderItem,
+    ArchivedOrder,
+    ArchivedOrderItem,
+    RestaurantDailyStats,
+    RevokedToken,
+    Task,
+)
+from service_api import passwords
+from service_api.pagination import IdCursorPagination
+from service_api.permissions import CustomerCancellOrderPermission, get_view_object
+from service_api.routers import pin_key
+from service_api.search import open_at_q, restaurant_index
+from service_api.stats import STATS_SUM_FIELDS
+from service_api.tasks import claim_tasks, enqueue, queue_gauges, run_task
+from service_api.throttling import LoginUsernameThrottle
+from service_api.transitions import OrderStateConflict, transition_order
+
+
+API_PREFIX = "/api/v1/"
+
+# Payloads of the record_task calls made by the task worker
+TASK_CALLS = []
+
+
+def record_task(**payload):
+    TASK_CALLS.append(payload)
+
+
+def failing_task(**payload):
+    raise RuntimeError("Task failed.")
+
+
+def create_user(username, is_manager=False, is_staff=False):
+    user = User.objects.create(
+        username=username,
+        first_name=username,
+        last_name=username,
+        is_staff=is_staff,
+    )
+    user.set_password("password")
+    user.save()
+    Profile.objects.create(user=user, gender="M", city="Tehran", is_manager=is_manager)
+    return user
+
+
+def create_restaurant(manager, name="Restaurant", **kwargs):
+    fields = {
+        "food_type": "Persian",
+        "city": "Tehran",
+        "address": "Street",
+        "open_time": datetime.time(9, 0),
+        "close_time": datetime.time(23, 0),
+    }
+    fields.update(kwargs)
+    return Restaurant.objects.create(manager=manager, name=name, **fields)
+
+
+def create_food(restaurant, name="Kebab", price="10.00", **kwargs):
+    return Food.objects.create(restaurant=restaurant, name=name, price=price, **kwargs)
+
+
+class ServiceApiTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.manager = create_user("manager", is_manager=True)
+        self.customer = create_user("customer")
+        self.restaurant = create_restaurant(self.manager)
+        self.food = create_food(self.restaurant)
+
+    def place_order(self, foods=None, customer=None):
+        self.client.force_authenticate(customer or self.customer)
+        response = self.client.post(
+            API_PREFIX + "customer/neworder/",
+            {"foods": [food.pk for food in foods or [self.food]]},
+            format="json",
+        )
+        self.client.force_authenticate(None)
+        return response
+
+    @contextmanager
+    def committed(self):
+        """
+        Run the on_commit callbacks registered inside the block, which the
+        transaction wrapping every test would never run.
+        """
+        start = len(connection.run_on_commit)
+        yield
+        for _, callback in connection.run_on_commit[start:]:
+            callback()
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, format="json")
+        self.assertLess(response.status_code, 300)
+        return len(context)
+
+
+class PlaceOrderTests(ServiceApiTestCase):
+    def test_order_stores_its_restaurant(self):
+        response = self.place_order()
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data["id"])
+        self.assertEqual(order.restaurant, self.restaurant)
+
+    def test_items_keep_quantity_and_price_snapshot(self):
+        rice = create_food(self.restaurant, "Rice", "2.50")
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(
+            API_PREFIX + "customer/neworder/",
+            {"foods": [self.food.pk], "items": [{"food": rice.pk, "quantity": 3}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["total"], "17.50")
+        self.assertEqual(response.data["foods"], [self.food.pk, rice.pk])
+
+        rice.price = "9.00"
+        rice.save()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(API_PREFIX + "customer/activeorders/")
+        self.assertFalse(any("service_api_food" in q["sql"] for q in context))
+        order = response.data["results"][0]
+        self.assertEqual(order["total"], "17.50")
+        self.assertEqual(
+            order["items"],
+            [
+                {"food": self.food.pk, "quantity": 1, "unit_price": "10.00"},
+                {"food": rice.pk, "quantity": 3, "unit_price": "2.50"},
+            ],
+        )
+
+    def test_items_default_to_one(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(
+            API_PREFIX + "customer/neworder/",
+            {"items": [{"food": self.food.pk}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["items"][0]["quantity"], 1)
+
+        response = self.client.post(
+            API_PREFIX + "customer/neworders/bulk/",
+            {"orders": [{"items": [{"food": self.food.pk}]}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["status"], 201)
+
+    def test_quantity_and_total_are_bounded(self):
+        self.client.force_authenticate(self.customer)
+        url = API_PREFIX + "customer/neworder/"
+        items = [{"food": self.food.pk, "quantity": 10 ** 12}]
+        response = self.client.post(url, {"items": items}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("items", response.data)
+
+        expensive = create_food(self.restaurant, "Caviar", "99999999.99")
+        items = [{"food": expensive.pk, "quantity": 1000}]
+        response = self.client.post(url, {"items": items}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_foods_from_different_restaurants_are_rejected(self):
+        other = create_restaurant(create_user("other", is_manager=True), "Other")
+        response = self.place_order(foods=[self.food, create_food(other)])
+        self.assertEqual(response.status_code, 400)
+
+
+class ManagerOrderListTests(ServiceApiTestCase):
+    def test_manager_sees_orders_of_every_food(self):
+        second_food = create_food(self.restaurant, "Rice")
+        self.place_order(foods=[self.food])
+        self.place_order(foods=[second_food])
+        other = create_restaurant(create_user("other", is_manager=True), "Other")
+        self.place_order(foods=[create_food(other)])
+
+        self.client.force_authenticate(self.manager)
+        response = self.client.get(API_PREFIX + "manager/activeorders/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_only_restaurant_manager_can_accept(self):
+        order_id = self.place_order().data["id"]
+        other = create_user("other", is_manager=True)
+        create_restaurant(other, "Other")
+
+        self.client.force_authenticate(other)
+        url = API_PREFIX + "manager/accept/{}/".format(order_id)
+        response = self.client.patch(url, {"is_accepted": True}, format="json")
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.manager)
+        response = self.client.patch(url, {"is_accepted": True}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Order.objects.get(pk=order_id).is_accepted)
+
+
+class OrderStatusTests(ServiceApiTestCase):
+    def test_order_lists_follow_status(self):
+        cancelled_id = self.place_order().data["id"]
+        delivered_id = self.place_order().data["id"]
+
+        self.client.force_authenticate(self.customer)
+        self.client.patch(
+            API_PREFIX + "customer/cancell/{}/".format(cancelled_id),
+            {"is_cancelled": True},
+            format="json",
+        )
+        self.client.force_authenticate(self.manager)
+        self.client.patch(
+            API_PREFIX + "manager/accept/{}/".format(delivered_id),
+            {"is_accepted": True},
+            format="json",
+        )
+        self.client.force_authenticate(self.customer)
+        self.client.patch(
+            API_PREFIX + "customer/approvedelivered/{}/".format(delivered_id),
+            {"is_delivered": True},
+            format="json",
+        )
+
+        self.assertEqual(Order.objects.get(pk=cancelled_id).status, Order.CANCELLED)
+        self.assertEqual(Order.objects.get(pk=delivered_id).status, Order.DELIVERED)
+        response = self.client.get(API_PREFIX + "customer/deliveredorders/")
+        orders = response.data["results"]
+        self.assertEqual([order["id"] for order in orders], [delivered_id])
+        self.assertTrue(orders[0]["is_accepted"])
+        self.assertTrue(orders[0]["is_delivered"])
+        self.assertFalse(orders[0]["is_cancelled"])
+        response = self.client.get(API_PREFIX + "customer/activeorders/")
+        self.assertEqual(response.data["results"], [])
+
+    def test_concurrently_changed_order_gets_409(self):
+        order_id = self.place_order().data["id"]
+
+        def accept_meanwhile(permission, request, view):
+            get_view_object(view)
+            Order.objects.filter(pk=order_id).update(status=Order.ACCEPTED)
+            return True
+
+        self.client.force_authenticate(self.customer)
+        with mock.patch.object(
+            CustomerCancellOrderPermission, "has_permission", accept_meanwhile
+        ):
+            response = self.client.patch(
+                API_PREFIX + "customer/cancell/{}/".format(order_id),
+                {"is_cancelled": True},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.get(pk=order_id).status, Order.ACCEPTED)
+
+    def test_transition_can_not_be_undone(self):
+        order_id = self.place_order().data["id"]
+        self.client.force_authenticate(self.customer)
+        response = self.client.patch(
+            API_PREFIX + "customer/cancell/{}/".format(order_id),
+            {"is_cancelled": False},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class PaginationTests(ServiceApiTestCase):
+    def test_order_list_pages_are_bounded_and_newest_first(self):
+        order_ids = [self.place_order().data["id"] for _ in range(5)]
+
+        self.client.force_authenticate(self.customer)
+        url = API_PREFIX + "customer/activeorders/?page_size=2"
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            seen.extend(order["id"] for order in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, order_ids[::-1])
+
+    def test_page_size_is_capped(self):
+        for index in range(3):
+            create_restaurant(create_user("m{}".format(index)), str(index))
+        with mock.patch.object(IdCursorPagination, "max_page_size", 2):
+            response = self.client.get(API_PREFIX + "restaurants/?page_size=100")
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+
+
+class QueryCountTests(ServiceApiTestCase):
+    def assert_constant_queries(self, user, url, add_rows):
+        with self.committed():
+            add_rows(1)
+        self.client.force_authenticate(user)
+        few = self.count_queries("get", API_PREFIX + url)
+        with self.committed():
+            add_rows(5)
+        self.client.force_authenticate(user)
+        many = self.count_queries("get", API_PREFIX + url)
+        self.assertEqual(few, many, url)
+
+    def add_orders(self, count, status=Order.PENDING):
+        for _ in range(count):
+            order_id = self.place_order(foods=[self.food, self.second_food]).data["id"]
+            Order.objects.filter(pk=order_id).update(status=status)
+
+    def setUp(self):
+        super().setUp()
+        self.second_food = create_food(self.restaurant, "Rice")
+
+    def test_order_lists(self):
+        for status, url in (
+            (Order.PENDING, "activeorders/"),
+            (Order.CANCELLED, "cancelledorders/"),
+            (Order.DELIVERED, "deliveredorders/"),
+        ):
+            def add_orders(count, status=status):
+                self.add_orders(count, status)
+
+            self.assert_constant_queries(self.customer, "customer/" + url, add_orders)
+            self.assert_constant_queries(self.manager, "manager/" + url, add_orders)
+
+    def test_catalogue_lists(self):
+        def add_restaurants(count):
+            for index in range(count):
+                manager = create_user("m{}".format(Restaurant.objects.count()))
+                create_restaurant(manager, str(index))
+
+        def add_foods(count):
+            for index in range(count):
+                create_food(self.restaurant, str(index))
+
+        admin = create_user("admin", is_staff=True)
+        self.assert_constant_queries(None, "restaurants/", add_restaurants)
+        self.assert_constant_queries(admin, "users/", add_restaurants)
+        self.assert_constant_queries(self.manager, "manager/foods/", add_foods)
+
+    def test_place_order(self):
+        foods = [create_food(self.restaurant, str(index)) for index in range(5)]
+        self.client.force_authenticate(self.customer)
+        url = API_PREFIX + "customer/neworder/"
+        # The first order of the day creates the daily rollup.
+        self.place_order()
+        self.client.force_authenticate(self.customer)
+        few = self.count_queries("post", url, {"foods": [foods[0].pk]})
+        many = self.count_queries("post", url, {"foods": [f.pk for f in foods]})
+        self.assertEqual(few, many)
+
+
+class TransitionQueryTests(ServiceApiTestCase):
+    def transition_queries(self, user, url):
+        order_id = self.place_order().data["id"]
+        self.client.force_authenticate(user)
+        return self.count_queries("patch", API_PREFIX + url.format(order_id), {})
+
+    def test_order_is_loaded_once(self):
+        # One query to load the order with its restaurant, then the order and
+        # its daily rollup are updated inside a savepoint.
+        for user, url in (
+            (self.customer, "customer/cancell/{}/"),
+            (self.manager, "manager/accept/{}/"),
+            (self.manager, "manager/cancell/{}/"),
+        ):
+            self.assertEqual(self.transition_queries(user, url), 5, url)
+
+    def test_customer_can_only_cancell_own_orders(self):
+        other = create_user("other")
+        self.place_order(customer=other)
+        order_id = self.place_order().data["id"]
+        self.client.force_authenticate(other)
+        response = self.client.patch(
+            API_PREFIX + "customer/cancell/{}/".format(order_id),
+            {"is_cancelled": True},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class RestaurantCatalogueTests(ServiceApiTestCase):
+    url = API_PREFIX + "restaurants/"
+
+    def test_cached_catalogue_needs_no_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_restaurant_changes_invalidate_catalogue(self):
+        etag = self.client.get(self.url)["ETag"]
+        manager = create_user("other", is_manager=True)
+        self.client.force_authenticate(manager)
+        with self.committed():
+            self.client.post(
+                API_PREFIX + "manager/newrestaurant/",
+                {
+                    "name": "Other",
+                    "food_type": "Italian",
+                    "city": "Tehran",
+                    "address": "Street",
+                    "open_time": "09:00",
+                    "close_time": "23:00",
+                },
+                format="json",
+            )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        self.restaurant.name = "Renamed"
+        with self.committed():
+            self.restaurant.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["results"][0]["name"], "Renamed")
+
+
+class RestaurantMenuTests(ServiceApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = API_PREFIX + "restaurants/{}/foods/".format(self.restaurant.pk)
+        create_food(self.restaurant, "Salad", "5.00", is_vegan=True, is_organic=True)
+        create_food(self.restaurant, "Soup", "7.50", is_vegan=True)
+
+    def names(self, query=""):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return [food["name"] for food in response.data]
+
+    def test_filters_are_served_from_cache(self):
+        self.assertEqual(self.names(), ["Kebab", "Salad", "Soup"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names("?is_vegan=true"), ["Salad", "Soup"])
+            self.assertEqual(self.names("?is_organic=false"), ["Kebab", "Soup"])
+            self.assertEqual(self.names("?min_price=6&max_price=8"), ["Soup"])
+
+    def test_food_changes_invalidate_menu(self):
+        self.names()
+        self.client.force_authenticate(self.manager)
+        with self.committed():
+            self.client.post(
+                API_PREFIX + "manager/foods/",
+                {"name": "Pizza", "price": "12.00"},
+                format="json",
+            )
+            self.client.patch(
+                API_PREFIX + "manager/updatefood/{}/".format(self.food.pk),
+                {"price": "20.00"},
+                format="json",
+            )
+        self.assertEqual(self.names("?min_price=11"), ["Kebab", "Pizza"])
+
+    def test_invalid_filter_and_missing_restaurant(self):
+        self.assertEqual(self.client.get(self.url + "?min_price=x").status_code, 400)
+        response = self.client.get(API_PREFIX + "restaurants/0/foods/")
+        self.assertEqual(response.status_code, 404)
+
+
+class RestaurantSearchTests(ServiceApiTestCase):
+    url = API_PREFIX + "restaurants/search/"
+
+    def setUp(self):
+        super().setUp()
+        self.night = create_restaurant(
+            create_user("night"),
+            "Night",
+            food_type="Fast Food",
+            open_time=datetime.time(20, 0),
+            close_time=datetime.time(2, 0),
+        )
+        self.other_city = create_restaurant(
+            create_user("karaj"), "Karaj", city="Karaj"
+        )
+
+    def search(self, query):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return [restaurant["id"] for restaurant in response.data["results"]]
+
+    def test_city_and_food_type(self):
+        self.assertEqual(
+            self.search("?city=tehran"), [self.restaurant.pk, self.night.pk]
+        )
+        self.assertEqual(
+            self.search("?food_type=Persian&city=Karaj"), [self.other_city.pk]
+        )
+
+    def test_open_at_handles_midnight(self):
+        self.assertEqual(self.search("?city=Tehran&open_at=01:00"), [self.night.pk])
+        self.assertEqual(
+            self.search("?city=Tehran&open_at=21:00"),
+            [self.restaurant.pk, self.night.pk],
+        )
+        self.assertEqual(self.search("?city=Tehran&open_at=23:30"), [self.night.pk])
+
+    def test_index_matches_orm_filter(self):
+        create_restaurant(
+            create_user("allday"),
+            "All day",
+            open_time=datetime.time(0, 0),
+            close_time=datetime.time(0, 0),
+        )
+        for hour in range(24):
+            at = datetime.time(hour, 30)
+            expected = list(
+                Restaurant.objects.filter(open_at_q(at))
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            self.assertEqual(restaurant_index.search(at=at), expected, at)
+
+    def test_index_is_updated_incrementally(self):
+        self.search("?city=Tehran")
+        self.night.city = "Karaj"
+        with self.committed():
+            self.night.save()
+            # Nothing changes before the save commits.
+            self.assertEqual(self.search("?city=Karaj"), [self.other_city.pk])
+        with mock.patch.object(restaurant_index, "_build") as build:
+            self.assertEqual(
+                self.search("?city=Karaj&food_type=fast food"), [self.night.pk]
+            )
+        build.assert_not_called()
+
+    def test_pages_load_only_their_restaurants(self):
+        self.search("?city=Tehran")
+        url = self.url + "?page_size=1"
+        pks = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            # The page size plus the one row telling whether a next page exists
+            in_list = queries[0]["sql"].rsplit(" IN (", 1)[1].split(")")[0]
+            self.assertEqual(len(queries), 1)
+            self.assertLessEqual(len(in_list.split(",")), 2)
+            pks += [restaurant["id"] for restaurant in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(pks, sorted(pks))
+        self.assertEqual(len(pks), Restaurant.objects.count())
+
+
+class FoodSearchTests(ServiceApiTestCase):
+    url = API_PREFIX + "foods/search/"
+
+    def search(self, query):
+        response = self.client.get(self.url, query)
+        self.assertEqual(response.status_code, 200)
+        return [food["name"] for food in response.data["results"]]
+
+    def test_ranked_prefix_search(self):
+        create_food(self.restaurant, "Chicken Kebab")
+        create_food(self.restaurant, "Rice")
+        pizzeria = create_restaurant(
+            create_user("pizza"), "Kebab House", food_type="Italian"
+        )
+        create_food(pizzeria, "Pizza")
+
+        self.assertEqual(self.search({"q": "keb"})[:2], ["Kebab", "Chicken Kebab"])
+        self.assertEqual(
+            set(self.search({"q": "keb"})), {"Kebab", "Chicken Kebab", "Pizza"}
+        )
+        self.assertEqual(self.search({"q": "italian pizza"}), ["Pizza"])
+        self.assertEqual(self.search({"q": '"'}), [])
+
+    def test_index_follows_changes(self):
+        self.food.name = "Pasta"
+        self.food.save()
+        self.assertEqual(self.search({"q": "pasta"}), ["Pasta"])
+        self.restaurant.food_type = "Italian"
+        self.restaurant.save()
+        self.assertEqual(self.search({"q": "italian"}), ["Pasta"])
+        Food.objects.filter(pk=self.food.pk).delete()
+        self.assertEqual(self.search({"q": "pasta"}), [])
+
+    def test_pagination_and_missing_query(self):
+        for index in range(5):
+            create_food(self.restaurant, "Soup {}".format(index))
+        response = self.client.get(self.url, {"q": "soup", "page_size": 2})
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+
+class BulkOrderTests(ServiceApiTestCase):
+    def test_bulk_place_orders(self):
+        other = create_restaurant(create_user("other", is_manager=True), "Other")
+        other_food = create_food(other)
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(
+            API_PREFIX + "customer/neworders/bulk/",
+            {
+                "orders": [
+                    {"foods": [self.food.pk], "note": "first"},
+                    {"foods": [self.food.pk, other_food.pk]},
+                    {"foods": [0]},
+                    {"foods": []},
+                    {"foods": [other_food.pk, other_food.pk]},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual([r["status"] for r in results], [201, 400, 400, 400, 201])
+
+        first = Order.objects.get(pk=results[0]["id"])
+        self.assertEqual(first.note, "first")
+        self.assertEqual(first.restaurant, self.restaurant)
+        self.assertEqual(list(first.foods.all()), [self.food])
+        last = Order.objects.get(pk=results[4]["id"])
+        self.assertEqual(last.restaurant, other)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_bulk_place_orders_is_bounded(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(
+            API_PREFIX + "customer/neworders/bulk/",
+            {"orders": [{"foods": [self.food.pk]}] * (settings.BULK_MAX_ITEMS + 1)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_accept(self):
+        pending = self.place_order().data["id"]
+        cancelled = self.place_order().data["id"]
+        Order.objects.filter(pk=cancelled).update(status=Order.CANCELLED)
+        other = create_restaurant(create_user("other", is_manager=True), "Other")
+        foreign = self.place_order(foods=[create_food(other)]).data["id"]
+
+        self.client.force_authenticate(self.manager)
+        # Restaurant permission check, savepoint, UPDATE, accepted orders,
+        # rollup UPDATE, owned orders, savepoint release.
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                API_PREFIX + "manager/orders/bulk-accept/",
+                {"orders": [pending, cancelled, foreign], "time_to_deliver": 45},
+                format="json",
+            )
+        results = response.data["results"]
+        self.assertEqual([r["status"] for r in results], [200, 409, 404])
+        order = Order.objects.get(pk=pending)
+        self.assertEqual(order.status, Order.ACCEPTED)
+        self.assertEqual(order.time_to_deliver, 45)
+        self.assertIsNotNone(order.accept_datetime)
+        self.assertEqual(Order.objects.get(pk=foreign).status, Order.PENDING)
+
+
+class OrderDeadlineTests(ServiceApiTestCase):
+    def accept(self, order_id, **data):
+        self.client.force_authenticate(self.manager)
+        response = self.client.patch(
+            API_PREFIX + "manager/accept/{}/".format(order_id),
+            dict(is_accepted=True, **data),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return Order.objects.get(pk=order_id)
+
+    def test_deadline_is_stored_on_accept(self):
+        order = self.accept(self.place_order().data["id"], time_to_deliver=45)
+        self.assertEqual(
+            order.due_datetime, order.accept_datetime + datetime.timedelta(minutes=45)
+        )
+
+        orders = [self.place_order().data["id"] for _ in range(2)]
+        Order.objects.filter(pk=orders[1]).update(time_to_deliver=90)
+        self.client.force_authenticate(self.manager)
+        self.client.post(
+            API_PREFIX + "manager/orders/bulk-accept/",
+            {"orders": orders},
+            format="json",
+        )
+        for order in Order.objects.filter(pk__in=orders):
+            self.assertEqual(
+                order.due_datetime,
+                order.accept_datetime
+                + datetime.timedelta(minutes=order.time_to_deliver),
+            )
+
+    def test_time_to_deliver_is_bounded(self):
+        order_id = self.place_order().data["id"]
+        self.client.force_authenticate(self.manager)
+        response = self.client.patch(
+            API_PREFIX + "manager/accept/{}/".format(order_id),
+            {"is_accepted": True, "time_to_deliver": 10 ** 12},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            API_PREFIX + "manager/orders/bulk-accept/",
+            {"orders": [order_id], "time_to_deliver": 10 ** 12},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.get(pk=order_id).status, Order.PENDING)
+
+    def test_overdue_orders_endpoint(self):
+        late, later, on_time = (
+            self.accept(self.place_order().data["id"]) for _ in range(3)
+        )
+        now = timezone.now()
+        Order.objects.filter(pk=late.pk).update(
+            due_datetime=now - datetime.timedelta(minutes=5)
+        )
+        Order.objects.filter(pk=later.pk).update(
+            due_datetime=now - datetime.timedelta(minutes=10)
+        )
+        self.place_order()
+
+        self.client.force_authenticate(self.manager)
+        response = self.client.get(API_PREFIX + "manager/overdue/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [order["id"] for order in response.data["results"]], [later.pk, late.pk]
+        )
+        self.client.force_authenticate(self.customer)
+        response = self.client.get(API_PREFIX + "manager/overdue/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_scheduler_flags_orders_when_their_deadline_passes(self):
+        late, soon, later, delivered = (
+            self.accept(self.place_order().data["id"]) for _ in range(4)
+        )
+        now = timezone.now()
+        for order, minutes in ((late, -1), (soon, 5), (later, 60), (delivered, -1)):
+            Order.objects.filter(pk=order.pk).update(
+                due_datetime=now + datetime.timedelta(minutes=minutes)
+            )
+        Order.objects.filter(pk=delivered.pk).update(status=Order.DELIVERED)
+
+        scheduler = DeadlineScheduler(horizon=600, refresh=30)
+        self.assertEqual([order.pk for order in scheduler.run_pending(now)], [late.pk])
+        self.assertEqual([pk for _, pk in scheduler.heap], [soon.pk])
+        self.assertEqual(scheduler.wake_up_at(), now + datetime.timedelta(seconds=30))
+        self.assertEqual(Order.objects.get(pk=late.pk).overdue_datetime, now)
+
+        then = now + datetime.timedelta(minutes=6)
+        self.assertEqual([order.pk for order in scheduler.run_pending(then)], [soon.pk])
+        self.assertEqual(scheduler.run_pending(then), [])
+        self.assertIsNone(Order.objects.get(pk=later.pk).overdue_datetime)
+        self.assertIsNone(Order.objects.get(pk=delivered.pk).overdue_datetime)
+
+        Order.objects.filter(pk=later.pk).update(
+            due_datetime=now - datetime.timedelta(minutes=1)
+        )
+        output = io.StringIO()
+        call_command("watch_deadlines", once=True, stdout=output)
+        self.assertIn("Flagged 1 overdue orders.", output.getvalue())
+
+
+class ManagerStatsTests(ServiceApiTestCase):
+    def transition(self, user, url, order_id, data):
+        self.client.force_authenticate(user)
+        response = self.client.patch(
+            API_PREFIX + url.format(order_id), data, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def rollups(self):
+        return list(
+            RestaurantDailyStats.objects.order_by("restaurant", "day").values(
+                "restaurant", "day", *STATS_SUM_FIELDS
+            )
+        )
+
+    def test_rollups_follow_transitions_and_match_rebuild(self):
+        delivered, cancelled, accepted = (self.place_order().data for _ in range(3))
+        self.place_order()
+        self.transition(
+            self.manager, "manager/accept/{}/", delivered["id"], {"is_accepted": True}
+        )
+        self.transition(
+            self.customer,
+            "customer/approvedelivered/{}/",
+            delivered["id"],
+            {"is_delivered": True},
+        )
+        self.transition(
+            self.customer,
+            "customer/cancell/{}/",
+            cancelled["id"],
+            {"is_cancelled": True},
+        )
+        self.client.force_authenticate(self.manager)
+        self.client.post(
+            API_PREFIX + "manager/orders/bulk-accept/",
+            {"orders": [accepted["id"]]},
+            format="json",
+        )
+
+        (rollup,) = self.rollups()
+        self.assertEqual(rollup["placed_orders"], 4)
+        self.assertEqual(rollup["accepted_orders"], 2)
+        self.assertEqual(rollup["cancelled_orders"], 1)
+        self.assertEqual(rollup["delivered_orders"], 1)
+        self.assertEqual(rollup["revenue"], Decimal(delivered["total"]))
+        self.assertEqual(rollup["timed_deliveries"], 1)
+
+        incremental = self.rollups()
+        call_command("rebuild_stats", chunk_size=1, stdout=io.StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+        self.client.force_authenticate(self.manager)
+        response = self.client.get(API_PREFIX + "manager/stats/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["days"]), 1)
+        self.assertEqual(response.data["days"][0]["cancellation_rate"], 0.25)
+        self.assertEqual(response.data["totals"]["placed_orders"], 4)
+        self.assertEqual(response.data["end"], timezone.localdate())
+
+    def test_stats_range_is_validated(self):
+        self.client.force_authenticate(self.manager)
+        for query in ("?start=2021-02-01&end=2021-01-01", "?start=2000-01-01"):
+            response = self.client.get(API_PREFIX + "manager/stats/" + query)
+            self.assertEqual(response.status_code, 400, query)
+        self.client.force_authenticate(self.customer)
+        response = self.client.get(API_PREFIX + "manager/stats/")
+        self.assertEqual(response.status_code, 403)
+
+
+class OrderExportTests(ServiceApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.orders = [self.place_order().data["id"] for _ in range(3)]
+        Order.objects.filter(pk=self.orders[0]).update(
+            create_datetime=timezone.now() - datetime.timedelta(days=10)
+        )
+        other = create_restaurant(create_user("other", is_manager=True), "Other")
+        self.foreign = self.place_order(foods=[create_food(other)]).data["id"]
+
+    def export(self, url, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(API_PREFIX + url)
+        if response.status_code == 200:
+            self.assertTrue(response.streaming)
+        return response
+
+    def test_manager_csv_export(self):
+        response = self.export("manager/orders/export/", self.manager)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/csv"))
+        self.assertIn("orders.csv", response["Content-Disposition"])
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(","), list(EXPORT_FIELDS))
+        self.assertEqual([int(line.split(",")[0]) for line in lines[1:]], self.orders)
+
+    def test_csv_errors_are_plain_text(self):
+        response = self.export(
+            "manager/orders/export/?start=yesterday&status=lost", self.manager
+        )
+        self.assertEqual(response.status_code, 400)
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0], "start,status")
+        self.assertNotIn("ErrorDetail", lines[1])
+        self.assertIn("Date has wrong format.", lines[1])
+        self.assertIn('""lost"" is not a valid choice.', lines[1])
+
+    def test_ndjson_export_with_date_range(self):
+        start = (timezone.localdate() - datetime.timedelta(days=1)).isoformat()
+        response = self.export(
+            "manager/orders/export/?format=ndjson&start=" + start, self.manager
+        )
+        self.assertTrue(response["Content-Type"].startswith("application/x-ndjson"))
+        content = b"".join(response.streaming_content)
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row["id"] for row in rows], self.orders[1:])
+        self.assertEqual(rows[0]["status"], Order.PENDING)
+
+        response = self.export(
+            "manager/orders/export/?start=2021-01-01&end=2021-01-31", self.manager
+        )
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 1)
+
+    def test_staff_export_covers_every_restaurant(self):
+        response = self.export("orders/export/", self.manager)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.streaming)
+
+        response = self.export("orders/export/", create_user("staff", is_staff=True))
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(int(lines[-1].split(",")[0]), self.foreign)
+
+
+class OrderArchiveTests(ServiceApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.orders = [self.place_order().data["id"] for _ in range(5)]
+        now = timezone.now()
+        old = now - datetime.timedelta(days=100)
+        for order_id, status, finished, created in (
+            (self.orders[0], Order.DELIVERED, old, old),
+            (self.orders[1], Order.CANCELLED, old, old),
+            (self.orders[2], Order.DELIVERED, now, old),
+            (self.orders[3], Order.DELIVERED, old, old),
+        ):
+            Order.objects.filter(pk=order_id).update(
+                status=status,
+                create_datetime=created - datetime.timedelta(minutes=order_id),
+                accept_datetime=created,
+                **{
+                    "cancell_datetime"
+                    if status == Order.CANCELLED
+                    else "delivered_datetime": finished
+                }
+            )
+        # Finished before transition times were stored.
+        Order.objects.filter(pk=self.orders[3]).update(delivered_datetime=None)
+
+    def archive(self):
+        call_command("archive_orders", days=90, batch_size=2, stdout=io.StringIO())
+
+    def test_finished_orders_move_to_the_archive(self):
+        created = Order.objects.get(pk=self.orders[0]).create_datetime
+        self.archive()
+        archived = [self.orders[0], self.orders[1], self.orders[3]]
+        self.assertEqual(
+            list(ArchivedOrder.objects.order_by("pk").values_list("pk", flat=True)),
+            archived,
+        )
+        self.assertEqual(
+            list(Order.objects.order_by("pk").values_list("pk", flat=True)),
+            [self.orders[2], self.orders[4]],
+        )
+        self.assertFalse(OrderItem.objects.filter(order__in=archived).exists())
+        self.assertEqual(
+            ArchivedOrderItem.objects.filter(order=self.orders[0]).get().food_id,
+            self.food.pk,
+        )
+        self.assertEqual(
+            ArchivedOrder.objects.get(pk=self.orders[0]).create_datetime, created
+        )
+
+        self.archive()
+        self.assertEqual(ArchivedOrder.objects.count(), 3)
+
+    def test_archived_ids_are_not_reused(self):
+        Order.objects.filter(pk=self.orders[4]).update(
+            status=Order.CANCELLED,
+            cancell_datetime=timezone.now() - datetime.timedelta(days=100),
+        )
+        self.archive()
+        self.assertTrue(ArchivedOrder.objects.filter(pk=self.orders[4]).exists())
+        self.assertGreater(self.place_order().data["id"], self.orders[4])
+
+    def test_history_lists_read_both_stores(self):
+        self.archive()
+        self.client.force_authenticate(self.customer)
+        ids = []
+        url = API_PREFIX + "customer/deliveredorders/?page_size=1"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [order["id"] for order in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(ids, [self.orders[0], self.orders[2], self.orders[3]])
+
+        response = self.client.get(API_PREFIX + "customer/deliveredorders/")
+        archived = response.data["results"][0]
+        self.assertEqual(archived["foods"], [self.food.pk])
+        self.assertTrue(archived["is_delivered"])
+
+        self.client.force_authenticate(self.manager)
+        response = self.client.get(API_PREFIX + "manager/cancelledorders/")
+        self.assertEqual(
+            [order["id"] for order in response.data["results"]], [self.orders[1]]
+        )
+
+    def test_rollups_and_exports_include_the_archive(self):
+        call_command("rebuild_stats", stdout=io.StringIO())
+        fields = ("restaurant", "day") + STATS_SUM_FIELDS
+        rollups = list(RestaurantDailyStats.objects.order_by("day").values(*fields))
+        self.archive()
+        call_command("rebuild_stats", stdout=io.StringIO())
+        self.assertEqual(
+            list(RestaurantDailyStats.objects.order_by("day").values(*fields)),
+            rollups,
+        )
+
+        self.client.force_authenticate(self.manager)
+        response = self.client.get(API_PREFIX + "manager/orders/export/")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            sorted(int(line.split(",")[0]) for line in lines[1:]), self.orders
+        )
+
+
+class BearerTokenTests(ServiceApiTestCase):
+    def login(self, username):
+        response = self.client.post(
+            API_PREFIX + "login/",
+            {"username": username, "password": "password"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data["token"]
+
+    def test_token_authenticates_without_user_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.login("customer"))
+        response = self.client.post(
+            API_PREFIX + "customer/neworder/", {"foods": [self.food.pk]}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().customer, self.customer)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.login("manager"))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(API_PREFIX + "manager/activeorders/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 1)
+        for query in context.captured_queries:
+            self.assertNotIn("auth_user", query["sql"])
+            self.assertNotIn("service_api_profile", query["sql"])
+
+    def test_customer_token_is_not_a_manager(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.login("customer"))
+        response = self.client.get(API_PREFIX + "manager/activeorders/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_logout_revokes_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.login("customer"))
+        self.assertEqual(self.client.get(API_PREFIX + "logout/").status_code, 200)
+        response = self.client.get(API_PREFIX + "customer/activeorders/")
+        self.assertEqual(response.status_code, 403)
+        # The revocation is written through to the database.
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+    def test_tokens_are_checked_without_queries(self):
+        token = self.login("customer")
+        with self.assertNumQueries(0):
+            self.assertEqual(read_token(token)["uid"], self.customer.pk)
+
+    def test_invalid_and_expired_tokens_are_rejected(self):
+        token = self.login("customer")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + token[:-4])
+        response = self.client.get(API_PREFIX + "customer/activeorders/")
+        self.assertEqual(response.status_code, 403)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + token)
+        with self.settings(AUTH_TOKEN_TTL=-1):
+            response = self.client.get(API_PREFIX + "customer/activeorders/")
+        self.assertEqual(response.status_code, 403)
+
+
+class PasswordTests(ServiceApiTestCase):
+    def login(self, username="customer", password="password"):
+        return self.client.post(
+            API_PREFIX + "login/",
+            {"username": username, "password": password},
+            format="json",
+        )
+
+    def test_register_and_login(self):
+        response = self.client.post(
+            API_PREFIX + "register/",
+            {
+                "username": "new",
+                "password": "secret-password",
+                "first_name": "New",
+                "last_name": "User",
+                "profile": {"gender": "F", "city": "Tehran", "is_manager": False},
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.login("new", "secret-password").status_code, 200)
+        self.assertEqual(self.login("new", "wrong").status_code, 400)
+        self.assertEqual(self.login("missing").status_code, 400)
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        with self.settings(PASSWORD_HASH_ITERATIONS=1000):
+            self.customer.set_password("password")
+            self.customer.save()
+        with self.settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.assertEqual(self.login().status_code, 200)
+        self.customer.refresh_from_db()
+        self.assertIn("$2000$", self.customer.password)
+        self.assertTrue(self.customer.check_password("password"))
+
+    def test_login_is_rate_limited_per_username(self):
+        rates = {"login_username": "2/min"}
+        with mock.patch.dict(LoginUsernameThrottle.THROTTLE_RATES, rates):
+            self.assertEqual(self.login(password="wrong").status_code, 400)
+            self.assertEqual(self.login(password="wrong").status_code, 400)
+            self.assertEqual(self.login().status_code, 429)
+            self.assertEqual(self.login("manager").status_code, 200)
+
+    def test_full_hashing_pool_refuses_logins(self):
+        slots = mock.Mock(**{"acquire.return_value": False})
+        with mock.patch("service_api.passwords._executor", mock.Mock()):
+            with mock.patch("service_api.passwords._slots", slots):
+                self.assertEqual(self.login().status_code, 503)
+
+    def test_basic_authentication_is_refused(self):
+        credentials = base64.b64encode(b"customer:password").decode()
+        self.client.credentials(HTTP_AUTHORIZATION="Basic " + credentials)
+        response = self.client.get(API_PREFIX + "customer/activeorders/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_browsable_api_login_is_pooled_and_rate_limited(self):
+        url = API_PREFIX + "api-auth/login/"
+        rates = {"login_username": "2/min"}
+        with mock.patch(
+            "service_api.passwords._verify", wraps=passwords._verify
+        ) as verify:
+            with mock.patch.dict(LoginUsernameThrottle.THROTTLE_RATES, rates):
+                client = Client()
+                data = {"username": "customer", "password": "wrong"}
+                self.assertEqual(client.post(url, data).status_code, 200)
+                data["password"] = "password"
+                self.assertEqual(client.post(url, data).status_code, 302)
+                self.assertEqual(client.post(url, data).status_code, 429)
+        self.assertEqual(verify.call_count, 2)
+
+
+class MetricsTests(ServiceApiTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_staff_can_read_view_metrics(self):
+        self.client.force_authenticate(self.customer)
+        self.client.get(API_PREFIX + "customer/activeorders/")
+        self.assertEqual(self.client.get(API_PREFIX + "metrics/").status_code, 403)
+
+        self.client.force_authenticate(create_user("staff", is_staff=True))
+        response = self.client.get(API_PREFIX + "metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        self.assertIn("# TYPE service_api_db_queries summary", body)
+        view = 'view="service_api.views.CustomerActiveOrderList"'
+        self.assertIn(
+            "service_api_request_duration_seconds{%s,quantile=\"0.99\"}" % view, body
+        )
+        self.assertIn("service_api_db_queries_count{%s} 1" % view, body)
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram((1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.quantile(0.5), 1.75)
+        self.assertAlmostEqual(histogram.quantile(0.99), 9.7)
+
+    def test_requests_over_budget_are_logged(self):
+        self.client.force_authenticate(self.customer)
+        with self.settings(METRICS_QUERY_BUDGET=0):
+            with self.assertLogs("service_api.metrics", "WARNING") as logs:
+                self.client.get(API_PREFIX + "customer/activeorders/")
+        self.assertIn("/api/v1/customer/activeorders/", logs.output[0])
+
+
+class AsgiMiddlewareTests(ServiceApiTestCase):
+    @override_settings(DEBUG=True)
+    def test_middleware_chain_runs_async(self):
+        # The handler logs every middleware it has to adapt to async.
+        with self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler().load_middleware(is_async=True)
+
+    async def test_async_requests_are_measured_and_pinned(self):
+        registry.reset()
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.customer)
+        response = await client.post(
+            API_PREFIX + "customer/neworder/",
+            {"foods": [self.food.pk]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        body = registry.render()
+        view = 'view="service_api.views.CreateOrder"'
+        self.assertIn("service_api_db_queries_count{%s} 1" % view, body)
+        self.assertNotIn("service_api_db_queries_sum{%s} 0\n" % view, body)
+        self.assertTrue(cache.get(pin_key(self.customer.pk)))
+
+
+class GenerateDataTests(TestCase):
+    def test_generated_orders_are_consistent(self):
+        call_command(
+            "generate_data",
+            customers=5,
+            restaurants=2,
+            foods=3,
+            orders=50,
+            batch_size=20,
+            stdout=io.StringIO(),
+        )
+        self.assertEqual(Profile.objects.filter(is_manager=True).count(), 2)
+        self.assertEqual(Food.objects.count(), 6)
+        self.assertEqual(Order.objects.count(), 50)
+        for order in Order.objects.prefetch_related("items__food"):
+            items = order.items.all()
+            self.assertTrue(items)
+            self.assertEqual(
+                order.total, sum(item.unit_price * item.quantity for item in items)
+            )
+            restaurants = {item.food.restaurant_id for item in items}
+            self.assertEqual(restaurants, {order.restaurant_id})
+        self.assertGreater(
+            Order.objects.values("create_datetime__date").distinct().count(), 1
+        )
+        self.assertTrue(
+            User.objects.get(username="bench-customer-0").check_password("password")
+        )
+        placed = RestaurantDailyStats.objects.aggregate(Sum("placed_orders"))
+        self.assertEqual(placed["placed_orders__sum"], 50)
+
+    def test_generated_ids_follow_archived_orders(self):
+        options = {"customers": 2, "restaurants": 1, "foods": 2, "orders": 20}
+        call_command("generate_data", stdout=io.StringIO(), **options)
+        Order.objects.update(status=Order.DELIVERED)
+        call_command("archive_orders", days=0, batch_size=50, stdout=io.StringIO())
+        self.assertFalse(Order.objects.exists())
+
+        call_command("generate_data", prefix="more", stdout=io.StringIO(), **options)
+        archived = ArchivedOrder.objects.values_list("pk", flat=True)
+        self.assertGreater(Order.objects.aggregate(pk=Min("pk"))["pk"], max(archived))
+
+
+class ConcurrentTransitionTests(TransactionTestCase):
+    def test_only_one_concurrent_transition_wins(self):
+        manager = create_user("manager", is_manager=True)
+        food = create_food(create_restaurant(manager))
+        order = Order.objects.create(customer=create_user("customer"))
+        order.foods.add(food, through_defaults={"unit_price": food.price})
+
+        threads_count = 16
+        barrier = threading.Barrier(threads_count)
+        results = []
+
+        def transition(target_status):
+            barrier.wait()
+            try:
+                transition_order(Order(pk=order.pk), target_status)
+                results.append(target_status)
+            except OrderStateConflict:
+                results.append(None)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(
+                target=transition,
+                args=(Order.ACCEPTED if index % 2 else Order.CANCELLED,),
+            )
+            for index in range(threads_count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [status for status in results if status is not None]
+        self.assertEqual(len(results), threads_count)
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, winners[0])
+
+
+class ConcurrentWriterTests(TransactionTestCase):
+    def test_concurrent_order_placement_does_not_fail(self):
+        food = create_food(create_restaurant(create_user("manager", is_manager=True)))
+        customers = [create_user("customer{}".format(index)) for index in range(8)]
+        orders_per_customer = 10
+        barrier = threading.Barrier(len(customers))
+        statuses = []
+
+        def place_orders(customer):
+            client = APIClient()
+            client.force_authenticate(customer)
+            barrier.wait()
+            try:
+                for _ in range(orders_per_customer):
+                    response = client.post(
+                        API_PREFIX + "customer/neworder/",
+                        {"foods": [food.pk]},
+                        format="json",
+                    )
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=place_orders, args=(customer,))
+            for customer in customers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [201] * len(customers) * orders_per_customer)
+        self.assertEqual(Order.objects.count(), len(customers) * orders_per_customer)
+        self.assertEqual(
+            connection.cursor().execute("PRAGMA journal_mode").fetchone()[0], "wal"
+        )
+
+
+class TaskQueueTests(TransactionTestCase):
+    def setUp(self):
+        TASK_CALLS.clear()
+
+    def run_worker(self):
+        output = io.StringIO()
+        # Let the pool threads close their connections after every task.
+        with mock.patch.dict(connection.settings_dict, {"CONN_MAX_AGE": 0}):
+            call_command("run_tasks", once=True, workers=2, stdout=output)
+        return output.getvalue()
+
+    @override_settings(
+        ORDER_EVENT_TASKS={ORDER_CREATED: ["service_api.tests.record_task"]}
+    )
+    def test_order_events_queue_tasks_after_commit(self):
+        food = create_food(create_restaurant(create_user("manager", is_manager=True)))
+        client = APIClient()
+        client.force_authenticate(create_user("customer"))
+        order = client.post(
+            API_PREFIX + "customer/neworder/", {"foods": [food.pk]}, format="json"
+        ).data
+        payload = {"order_id": order["id"], "event": ORDER_CREATED}
+        self.assertEqual(Task.objects.get().payload, payload)
+        self.assertEqual(TASK_CALLS, [])
+
+        self.assertIn("Ran 1 tasks, 0 failed.", self.run_worker())
+        self.assertEqual(TASK_CALLS, [payload])
+        self.assertFalse(Task.objects.exists())
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                enqueue("service_api.tests.record_task")
+                raise RuntimeError
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASK_MAX_ATTEMPTS=2, TASK_RETRY_DELAY=60)
+    def test_failed_tasks_are_retried_with_backoff(self):
+        enqueue("service_api.tests.failing_task", order_id=1)
+        with self.assertLogs("service_api.tasks", "ERROR"):
+            self.assertIn("Ran 1 tasks, 1 failed.", self.run_worker())
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+        self.assertIn("Task failed.", task.last_error)
+        self.assertGreater(
+            task.run_datetime, timezone.now() + datetime.timedelta(seconds=50)
+        )
+        self.assertIn("Ran 0 tasks", self.run_worker())
+
+        Task.objects.update(run_datetime=timezone.now())
+        with self.assertLogs("service_api.tasks", "ERROR"):
+            self.run_worker()
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+
+    def test_tasks_of_dead_workers_are_claimed_again(self):
+        now = timezone.now()
+        lease = datetime.timedelta(seconds=settings.TASK_LEASE_SECONDS)
+        stale = Task.objects.create(
+            path="service_api.tests.record_task",
+            status=Task.RUNNING,
+            run_datetime=now - lease,
+            claim_datetime=now - lease - datetime.timedelta(seconds=1),
+        )
+        Task.objects.create(
+            path="service_api.tests.record_task",
+            status=Task.RUNNING,
+            run_datetime=now,
+            claim_datetime=now,
+        )
+        self.assertEqual(claim_tasks(10), [stale.pk])
+        self.assertEqual(claim_tasks(10), [])
+
+    def test_tasks_finished_by_another_worker_are_lost(self):
+        for _ in range(3):
+            enqueue("service_api.tests.record_task")
+        (lost,) = claim_tasks(1)
+        Task.objects.filter(pk=lost).delete()
+        with self.assertLogs("service_api.tasks", "WARNING"):
+            self.assertIsNone(run_task(lost))
+        self.assertIn("Ran 2 tasks, 0 failed.", self.run_worker())
+        self.assertEqual(len(TASK_CALLS), 2)
+
+    def test_queue_depth_and_lag_metrics(self):
+        Task.objects.create(
+            path="service_api.tests.record_task",
+            run_datetime=timezone.now() - datetime.timedelta(seconds=30),
+        )
+        Task.objects.create(
+            path="service_api.tests.record_task",
+            run_datetime=timezone.now() + datetime.timedelta(hours=1),
+        )
+        gauges = {name: value for name, _, value in queue_gauges()}
+        self.assertEqual(gauges["task_queue_depth"], 2)
+        self.assertGreaterEqual(gauges["task_queue_lag_seconds"], 30)
+        self.assertLess(gauges["task_queue_lag_seconds"], 60)
+
+        client = APIClient()
+        client.force_authenticate(create_user("staff", is_staff=True))
+        body = client.get(API_PREFIX + "metrics/").content.decode()
+        self.assertIn("# TYPE service_api_task_queue_depth gauge", body)
+        self.assertIn("service_api_task_queue_depth 2\n", body)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    A second SQLite file stands in for the replica, it is added after the
+    test databases are set up and filled with a copy of the primary.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.replica_dir = tempfile.mkdtemp()
+        cls.replica_path = os.path.join(cls.replica_dir, "replica.sqlite3")
+        connections.databases["replica"] = dict(
+            connections.databases["default"], NAME=cls.replica_path
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.databases["replica"]
+        shutil.rmtree(cls.replica_dir)
+        super().tearDownClass()
+
+    def replicate(self):
+        connections["replica"].close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.replica_path + suffix):
+                os.remove(self.replica_path + suffix)
+        connection.cursor().execute("VACUUM INTO %s", [self.replica_path])
+
+    def deliver_order(self, customer, food):
+        order = Order.objects.create(
+            customer=customer,
+            restaurant=food.restaurant,
+            status=Order.DELIVERED,
+            total=food.price,
+        )
+        order.foods.add(food, through_defaults={"unit_price": food.price})
+        return order
+
+    def test_history_reads_replica_until_own_write(self):
+        cache.clear()
+        customer = create_user("customer")
+        food = create_food(create_restaurant(create_user("manager", is_manager=True)))
+        self.deliver_order(customer, food)
+        self.replicate()
+        # Rows the replica has not caught up with yet.
+        self.deliver_order(customer, food)
+        cache.clear()
+
+        client = APIClient()
+        client.force_authenticate(customer)
+        response = client.get(API_PREFIX + "customer/deliveredorders/")
+        self.assertEqual(len(response.data["results"]), 1)
+        response = client.get(API_PREFIX + "customer/activeorders/")
+        self.assertEqual(len(response.data["results"]), 0)
+
+        response = client.post(
+            API_PREFIX + "customer/neworder/", {"foods": [food.pk]}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        response = client.get(API_PREFIX + "customer/deliveredorders/")
+        self.assertEqual(len(response.data["results"]), 2)
+
+        other = create_user("other")
+        client.force_authenticate(other)
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            client.get(API_PREFIX + "customer/deliveredorders/")
+        # One query for the live orders and one for the archived ones.
+        self.assertEqual(len(replica_queries), 2)
+
+    def test_catalogue_reads_primary_right_after_a_change(self):
+        create_restaurant(create_user("manager", is_manager=True))
+        self.replicate()
+        client = APIClient()
+        response = client.get(API_PREFIX + "restaurants/")
+        self.assertEqual(len(response.data["results"]), 1)
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            cache.delete(CATALOGUE_CHANGED_KEY)
+            cache.delete(CATALOGUE_VERSION_KEY)
+            client.get(API_PREFIX + "restaurants/")
+        self.assertEqual(len(replica_queries), 1)
+
+
+class OrderEventsTests(TransactionTestCase):
+    def session_key(self, user):
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    async def open_stream(self, session_key=None, headers=(), query_string=b""):
+        inbox, outbox = asyncio.Queue(), asyncio.Queue()
+        await inbox.put({"type": "http.request", "body": b"", "more_body": False})
+        headers = list(headers)
+        if session_key is not None:
+            cookie = "{}={}".format(settings.SESSION_COOKIE_NAME, session_key)
+            headers.append((b"cookie", cookie.encode()))
+        scope = {
+            "type": "http",
+            "path": settings.EVENTS_PATH,
+            "headers": headers,
+            "query_string": query_string,
+        }
+        task = asyncio.ensure_future(
+            order_events_application(scope, inbox.get, outbox.put)
+        )
+        start = await outbox.get()
+        return task, inbox, outbox, start["status"]
+
+    def test_order_events_are_pushed(self):
+        manager = create_user("manager", is_manager=True)
+        customer = create_user("customer")
+        restaurant = create_restaurant(manager)
+        order = Order.objects.create(customer=customer, restaurant=restaurant)
+        hub = get_event_hub()
+        session_keys = [self.session_key(user) for user in (customer, manager)]
+
+        async def scenario():
+            streams = [await self.open_stream(key) for key in session_keys]
+            self.assertEqual([stream[3] for stream in streams], [200, 200])
+            while not hub.subscriber_count("restaurant:{}".format(restaurant.pk)):
+                await asyncio.sleep(0.01)
+
+            await sync_to_async(transition_order)(order, Order.ACCEPTED)
+            for task, inbox, outbox, _ in streams:
+                message = await asyncio.wait_for(outbox.get(), timeout=5)
+                event, data = message["body"].decode().strip().split("\n")
+                self.assertEqual(event, "event: order.accepted")
+                self.assertEqual(json.loads(data[len("data: "):])["id"], order.pk)
+                await inbox.put({"type": "http.disconnect"})
+                await asyncio.wait_for(task, timeout=5)
+
+            other_task, _, _, status = await self.open_stream("missing")
+            self.assertEqual(status, 403)
+            await other_task
+
+        async_to_sync(scenario)()
+        self.assertEqual(hub.subscriber_count("customer:{}".format(customer.pk)), 0)
+
+    def test_bearer_tokens_open_the_stream(self):
+        manager = create_user("manager", is_manager=True)
+        restaurant = create_restaurant(manager)
+        token = issue_token(manager)
+        hub = get_event_hub()
+
+        async def scenario():
+            for options in (
+                {"headers": [(b"authorization", b"Bearer " + token.encode())]},
+                {"query_string": b"token=" + token.encode()},
+            ):
+                task, inbox, _, status = await self.open_stream(**options)
+                self.assertEqual(status, 200)
+                channel = "restaurant:{}".format(restaurant.pk)
+                while not hub.subscriber_count(channel):
+                    await asyncio.sleep(0.01)
+                await inbox.put({"type": "http.disconnect"})
+                await asyncio.wait_for(task, timeout=5)
+
+            await sync_to_async(revoke_token)(token)
+            task, _, _, status = await self.open_stream(
+                query_string=b"token=" + token.encode()
+            )
+            self.assertEqual(status, 403)
+            await task
+
+        async_to_sync(scenario)()
@@ -0,0 +1,37 @@
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginIPThrottle(SimpleRateThrottle):
+    """
+    Limit login attempts from a single client address.
+    """
+
+    scope = "login_ip"
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+class LoginUsernameThrottle(SimpleRateThrottle):
+    """
+    Limit login attempts against a single username from any address.
+    """
+
+    scope = "login_username"
+
+    def get_cache_key(self, request, view):
+        # Django's login form posts the username outside of a DRF request.
+        data = request.data if hasattr(request, "data") else request.POST
+        username = data.get("username")
+        if not isinstance(username, str) or not username:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": username.lower()}
+
+
+class RegisterThrottle(LoginIPThrottle):
+    """
+    Limit sign ups from a single client address.
+    """
+
+    scope = "register"
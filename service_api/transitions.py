@@ -0,0 +1,109 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from service_api.events import ORDER_EVENTS, publish_order_event
+from service_api.models import Order
+from service_api.stats import record_transition, record_transitions
+
+
+class OrderStateConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The order state has been changed by another request."
+    default_code = "conflict"
+
+
+# Target status: (statuses the order may be in, datetime field to stamp)
+TRANSITIONS = {
+    Order.ACCEPTED: ((Order.PENDING,), "accept_datetime"),
+    Order.CANCELLED: ((Order.PENDING,), "cancell_datetime"),
+    Order.DELIVERED: ((Order.ACCEPTED,), "delivered_datetime"),
+}
+
+
+def transition_order(order, target_status, **fields):
+    """
+    Move the order to target_status with a single conditional UPDATE.
+
+    The row is only updated if it is still in one of the statuses the
+    transition starts from, so concurrent transitions of the same order
+    can not both succeed. The loser gets an OrderStateConflict.
+    """
+    expected_statuses, datetime_field = TRANSITIONS[target_status]
+    fields[datetime_field] = timezone.now()
+    if target_status == Order.ACCEPTED:
+        fields["due_datetime"] = fields[datetime_field] + datetime.timedelta(
+            minutes=fields.get("time_to_deliver", order.time_to_deliver)
+        )
+    with transaction.atomic():
+        updated = Order.objects.filter(
+            pk=order.pk, status__in=expected_statuses
+        ).update(status=target_status, **fields)
+        if not updated:
+            raise OrderStateConflict()
+        record_transition(order, target_status, fields[datetime_field])
+
+    order.status = target_status
+    for name, value in fields.items():
+        setattr(order, name, value)
+    publish_order_event(order, ORDER_EVENTS[target_status])
+    return order
+
+
+def transition_orders(queryset, target_status, **fields):
+    """
+    Move every order of queryset which allows it to target_status with a
+    single conditional UPDATE, and return the set of moved primary keys.
+
+    Call it inside a transaction, so the rollups are updated together with
+    the orders.
+    """
+    expected_statuses, datetime_field = TRANSITIONS[target_status]
+    fields[datetime_field] = timezone.now()
+    if target_status == Order.ACCEPTED:
+        fields["due_datetime"] = _due_datetimes(
+            queryset.filter(status__in=expected_statuses), fields
+        )
+    queryset.filter(status__in=expected_statuses).update(
+        status=target_status, **fields
+    )
+    # Orders which already were in target_status were stamped at another
+    # time, so the datetime tells which rows this UPDATE moved.
+    moved = queryset.filter(
+        status=target_status, **{datetime_field: fields[datetime_field]}
+    ).only(
+        "id", "customer_id", "restaurant_id", "status", "total", "accept_datetime"
+    )
+    pks = set()
+    for order in moved:
+        publish_order_event(order, ORDER_EVENTS[target_status])
+        pks.add(order.pk)
+    record_transitions(moved, target_status, fields[datetime_field])
+    return pks
+
+
+def _due_datetimes(queryset, fields):
+    """
+    Return the delivery deadline of the orders of queryset accepted with
+    fields, as an expression when they keep their own time_to_deliver.
+    """
+    accepted = fields["accept_datetime"]
+    if "time_to_deliver" in fields:
+        return accepted + datetime.timedelta(minutes=fields["time_to_deliver"])
+    # Few distinct delivery times are in use, one CASE covers them all.
+    minutes = queryset.order_by().values_list("time_to_deliver", flat=True).distinct()
+    return Case(
+        *(
+            When(
+                time_to_deliver=value,
+                then=Value(accepted + datetime.timedelta(minutes=value)),
+            )
+            for value in minutes
+        ),
+        output_field=DateTimeField(),
+    )
@@ -1,3 +1,4 @@
+from django.contrib.auth.views import LogoutView
 from django.urls import include, path
 from django.views.generic import TemplateView
 
@@ -10,8 +11,19 @@ CUSTOMER_PREFIX = "customer"
 MANAGER_PREFIX = "manager"
 
 urlpatterns = [
-    # rest_framework Authentication
-    path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
+    # rest_framework Authentication, with the login view of service_api
+    path(
+        "api-auth/",
+        include(
+            (
+                [
+                    path("login/", views.BrowsableAPILogin.as_view(), name="login"),
+                    path("logout/", LogoutView.as_view(), name="logout"),
+                ],
+                "rest_framework",
+            )
+        ),
+    ),
     # OpenAPI and Swagger UI for API documentations
     path(
         "openapi",
@@ -35,13 +47,19 @@ urlpatterns = [
     path("login/", views.api_login.as_view()),
     path("logout/", views.api_logout),
     path("users/", views.UserList.as_view()),
+    path("metrics/", views.metrics),
+    path("orders/export/", views.OrderExport.as_view()),
     path("profile/", views.UserProfile.as_view()),
     path("restaurants/", views.RestaurantList.as_view()),
+    path("restaurants/search/", views.RestaurantSearch.as_view()),
+    path("restaurants/<int:pk>/foods/", views.RestaurantMenu.as_view()),
+    path("foods/search/", views.FoodSearch.as_view()),
     # Managers API URI
     path(f"{MANAGER_PREFIX}/newrestaurant/", views.CreateRestaurant.as_view()),
     path(f"{MANAGER_PREFIX}/foods/", views.ManagerFoodListCreate.as_view()),
     path(f"{MANAGER_PREFIX}/updatefood/<int:pk>/", views.UpdateFood.as_view()),
     path(f"{MANAGER_PREFIX}/activeorders/", views.ManagerActiveOrderList.as_view()),
+    path(f"{MANAGER_PREFIX}/overdue/", views.ManagerOverdueOrderList.as_view()),
     path(
         f"{MANAGER_PREFIX}/cancelledorders/",
         views.ManagerCancelledOrderList.as_view(),
@@ -52,8 +70,15 @@ urlpatterns = [
     ),
     path(f"{MANAGER_PREFIX}/cancell/<int:pk>/", views.ManagerCancellOrder.as_view()),
     path(f"{MANAGER_PREFIX}/accept/<int:pk>/", views.ManagerAcceptOrder.as_view()),
+    path(f"{MANAGER_PREFIX}/stats/", views.ManagerStats.as_view()),
+    path(f"{MANAGER_PREFIX}/orders/export/", views.ManagerOrderExport.as_view()),
+    path(
+        f"{MANAGER_PREFIX}/orders/bulk-accept/",
+        views.ManagerAcceptOrderBulk.as_view(),
+    ),
     # Customers API URI
     path(f"{CUSTOMER_PREFIX}/neworder/", views.CreateOrder.as_view()),
+    path(f"{CUSTOMER_PREFIX}/neworders/bulk/", views.CreateOrderBulk.as_view()),
     path(f"{CUSTOMER_PREFIX}/activeorders/", views.CustomerActiveOrderList.as_view()),
     path(
         f"{CUSTOMER_PREFIX}/cancelledorders/",
@@ -1,6 +1,10 @@
 from django.contrib.auth.models import User
-from django.contrib.auth import authenticate, login
+from django.contrib.auth.views import LoginView
+from django.conf import settings
+from django.db import connection, router
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.http import parse_etags
 
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
@@ -8,19 +12,64 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 
-from service_api.models import Restaurant, Food, Order
+from service_api.archive import OrderHistory
+from service_api.authentication import (
+    BearerTokenAuthentication,
+    issue_token,
+    revoke_token,
+)
+from service_api.bulk import place_orders, accept_orders
+from service_api.cache import (
+    catalogue_recently_changed,
+    get_or_set_catalogue,
+    get_or_set_menu,
+)
+from service_api.export import EXPORT_FIELDS, export_rows
+from service_api.events import ORDER_CREATED, publish_order_event
+from service_api.metrics import registry, render_gauges
+from service_api.models import Restaurant, Food, Order, RestaurantDailyStats
+from service_api.pagination import (
+    DueCursorPagination,
+    OrderCursorPagination,
+    SearchPagination,
+)
+from service_api.renderers import CSVRenderer, NDJSONRenderer
+from service_api.routers import read_from_replicas
+from service_api.stats import STATS_SUM_FIELDS
+from service_api.search import (
+    FoodSearchResults,
+    RestaurantSearchResults,
+    restaurant_index,
+)
+from service_api.tasks import queue_gauges
+from service_api.transitions import transition_order
+from service_api.throttling import (
+    LoginIPThrottle,
+    LoginUsernameThrottle,
+    RegisterThrottle,
+)
 from service_api.serializers import (
     UserSerializer,
     LoginSerializer,
     RestaurantSerializer,
     CreateRestaurantSerializer,
     FoodSerializer,
+    MenuFilterSerializer,
+    StatsRangeSerializer,
+    ExportFilterSerializer,
+    RestaurantDailyStatsSerializer,
+    FoodSearchSerializer,
+    RestaurantSearchSerializer,
     PlaceOrderSerializer,
     CancellOrderSerializer,
     ApproveDeliveredOrderSerializer,
     AcceptOrderSerializer,
+    BulkPlaceOrderSerializer,
+    BulkAcceptOrderSerializer,
 )
+from service_api.passwords import HashingBusy, authenticate_user
 from service_api.permissions import (
+    get_view_object,
     ManagerPermission,
     HasRestaurant,
     IsFoodOwner,
@@ -32,36 +81,99 @@ from service_api.permissions import (
 )
 
 
+class CachedObjectMixin:
+    """
+    Get the object from the per request cache shared with permissions.
+    """
+
+    def get_object(self):
+        obj = get_view_object(self)
+        if obj is None:
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class ReplicaReadMixin:
+    """
+    List from a read replica, for lists which tolerate slightly stale rows.
+    """
+
+    def list(self, request, *args, **kwargs):
+        with read_from_replicas(request.user):
+            return super().list(request, *args, **kwargs)
+
+
 class api_login(generics.CreateAPIView):
     """
     Login user with username and password.
     """
 
     serializer_class = LoginSerializer
+    throttle_classes = (LoginIPThrottle, LoginUsernameThrottle)
 
     def post(self, request):
-        username = request.data["username"]
-        password = request.data["password"]
-        user = authenticate(request, username=username, password=password)
+        username = request.data.get("username")
+        password = request.data.get("password")
+        if not username or not password:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        user = authenticate_user(username, password)
         if user is not None:
-            login(request, user)
-            return Response(status=status.HTTP_200_OK)
+            return Response(
+                {"token": issue_token(user), "expires_in": settings.AUTH_TOKEN_TTL},
+                status=status.HTTP_200_OK,
+            )
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
+class BrowsableAPILogin(LoginView):
+    """
+    Login form of the browsable API, throttled like api_login.
+    """
+
+    template_name = "rest_framework/login.html"
+    throttle_classes = (LoginIPThrottle, LoginUsernameThrottle)
+
+    def post(self, request, *args, **kwargs):
+        for throttle_class in self.throttle_classes:
+            if not throttle_class().allow_request(request, self):
+                return HttpResponse(status=status.HTTP_429_TOO_MANY_REQUESTS)
+        try:
+            return super().post(request, *args, **kwargs)
+        except HashingBusy as exc:
+            return HttpResponse(exc.detail, status=exc.status_code)
+
+
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def api_logout(request):
-    request.session.flush()
+    if isinstance(request.successful_authenticator, BearerTokenAuthentication):
+        revoke_token(request.auth)
+    else:
+        request.session.flush()
     return Response(status=status.HTTP_200_OK)
 
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def metrics(request):
+    """
+    Per view request metrics and task queue gauges in the Prometheus text
+    format.
+    """
+    return HttpResponse(
+        registry.render() + render_gauges(queue_gauges()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 class Register(generics.CreateAPIView):
     """
     Register a new account.
     """
 
     serializer_class = UserSerializer
+    throttle_classes = (RegisterThrottle,)
 
 
 class UserList(generics.ListCreateAPIView):
@@ -73,7 +185,7 @@ class UserList(generics.ListCreateAPIView):
         IsAuthenticated,
         IsAdminUser,
     )
-    queryset = User.objects.all()
+    queryset = User.objects.select_related("profile")
     serializer_class = UserSerializer
 
 
@@ -86,7 +198,11 @@ class UserProfile(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = UserSerializer
 
     def get_object(self):
-        return User.objects.filter(pk=self.request.user.pk).first()
+        return (
+            User.objects.select_related("profile")
+            .filter(pk=self.request.user.pk)
+            .first()
+        )
 
 
 class RestaurantList(generics.ListAPIView):
@@ -97,6 +213,82 @@ class RestaurantList(generics.ListAPIView):
     serializer_class = RestaurantSerializer
     queryset = Restaurant.objects.all()
 
+    def list(self, request, *args, **kwargs):
+        def build():
+            # A page cached from a lagging replica would outlive the lag.
+            if catalogue_recently_changed():
+                return super(RestaurantList, self).list(request).data
+            with read_from_replicas(request.user):
+                return super(RestaurantList, self).list(request).data
+
+        etag, data = get_or_set_catalogue(request, build)
+        headers = {"ETag": etag}
+        if_none_match = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
+
+
+class RestaurantSearch(generics.ListAPIView):
+    """
+    Search restaurants by city, food type and being open now or at open_at.
+    """
+
+    serializer_class = RestaurantSerializer
+
+    def get_queryset(self):
+        search = RestaurantSearchSerializer(data=self.request.query_params.dict())
+        search.is_valid(raise_exception=True)
+        at = search.validated_data.get("open_at")
+        if search.validated_data.get("open_now"):
+            at = timezone.localtime().time()
+        pks = restaurant_index.search(
+            city=search.validated_data.get("city"),
+            food_type=search.validated_data.get("food_type"),
+            at=at,
+        )
+        return RestaurantSearchResults(pks)
+
+
+class RestaurantMenu(generics.ListAPIView):
+    """
+    List of a restaurant's foods, filtered by is_vegan, is_organic,
+    min_price and max_price.
+    """
+
+    serializer_class = FoodSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return Food.objects.filter(restaurant=self.kwargs["pk"]).order_by("id")
+
+    def list(self, request, *args, **kwargs):
+        filters = MenuFilterSerializer(data=request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        menu = get_or_set_menu(self.kwargs["pk"], self.build_menu)
+        return Response(filters.filter(menu))
+
+    def build_menu(self):
+        if not Restaurant.objects.filter(pk=self.kwargs["pk"]).exists():
+            raise Http404
+        return list(self.get_serializer(self.get_queryset(), many=True).data)
+
+
+class FoodSearch(generics.ListAPIView):
+    """
+    Search foods of every restaurant by name, restaurant name and food type.
+    """
+
+    serializer_class = FoodSerializer
+    pagination_class = SearchPagination
+
+    def get_queryset(self):
+        search = FoodSearchSerializer(data=self.request.query_params.dict())
+        search.is_valid(raise_exception=True)
+        if connection.vendor != "sqlite":
+            return Food.objects.filter(name__icontains=search.validated_data["q"])
+        return FoodSearchResults(search.validated_data["q"])
+
 
 class CreateRestaurant(generics.CreateAPIView):
     """
@@ -110,7 +302,7 @@ class CreateRestaurant(generics.CreateAPIView):
     )
 
     def perform_create(self, serializer):
-        serializer.save(manager=self.request.user)
+        serializer.save(manager_id=self.request.user.pk)
 
 
 class ManagerFoodListCreate(generics.ListCreateAPIView):
@@ -134,7 +326,7 @@ class ManagerFoodListCreate(generics.ListCreateAPIView):
         serializer.save(restaurant=restaurant)
 
 
-class UpdateFood(generics.UpdateAPIView):
+class UpdateFood(CachedObjectMixin, generics.UpdateAPIView):
     """
     Update food information and price.
     """
@@ -146,7 +338,7 @@ class UpdateFood(generics.UpdateAPIView):
         HasRestaurant,
         IsFoodOwner,
     )
-    queryset = Food.objects.all()
+    queryset = Food.objects.select_related("restaurant")
 
 
 class CreateOrder(generics.CreateAPIView):
@@ -158,7 +350,23 @@ class CreateOrder(generics.CreateAPIView):
     permission_classes = (IsAuthenticated,)
 
     def perform_create(self, serializer):
-        serializer.save(customer=self.request.user)
+        order = serializer.save(customer_id=self.request.user.pk)
+        publish_order_event(order, ORDER_CREATED)
+
+
+class CreateOrderBulk(generics.GenericAPIView):
+    """
+    Place a list of orders and get the result of each one.
+    """
+
+    serializer_class = BulkPlaceOrderSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = place_orders(request.user, serializer.validated_data["orders"])
+        return Response({"results": results}, status=status.HTTP_200_OK)
 
 
 class CustomerActiveOrderList(generics.ListAPIView):
@@ -167,39 +375,46 @@ class CustomerActiveOrderList(generics.ListAPIView):
     """
 
     serializer_class = PlaceOrderSerializer
+    pagination_class = OrderCursorPagination
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
         return Order.objects.filter(
-            customer=self.request.user.pk, is_cancelled=False, is_delivered=False
-        )
+            customer=self.request.user.pk, status__in=Order.ACTIVE_STATUSES
+        ).prefetch_related("items")
 
 
-class CustomerCancelledOrderList(generics.ListAPIView):
+class CustomerCancelledOrderList(ReplicaReadMixin, generics.ListAPIView):
     """
-    List of customer's cancelled orders.
+    List of customer's cancelled orders, archived ones included.
     """
 
     serializer_class = PlaceOrderSerializer
+    pagination_class = OrderCursorPagination
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
-        return Order.objects.filter(customer=self.request.user.pk, is_cancelled=True)
+        return OrderHistory.filter_orders(
+            customer=self.request.user.pk, status=Order.CANCELLED
+        ).prefetch_related("items")
 
 
-class CustomerDeliveredOrderList(generics.ListAPIView):
+class CustomerDeliveredOrderList(ReplicaReadMixin, generics.ListAPIView):
     """
-    List of customer's delivered orders.
+    List of customer's delivered orders, archived ones included.
     """
 
     serializer_class = PlaceOrderSerializer
+    pagination_class = OrderCursorPagination
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
-        return Order.objects.filter(customer=self.request.user.pk, is_delivered=True)
+        return OrderHistory.filter_orders(
+            customer=self.request.user.pk, status=Order.DELIVERED
+        ).prefetch_related("items")
 
 
-class CustomerCancellOrder(generics.UpdateAPIView):
+class CustomerCancellOrder(CachedObjectMixin, generics.UpdateAPIView):
     """
     Cancell order if has permission to.
     """
@@ -210,13 +425,13 @@ class CustomerCancellOrder(generics.UpdateAPIView):
         IsCustomerOfOrder,
         CustomerCancellOrderPermission,
     )
-    queryset = Order.objects.all()
+    queryset = Order.objects.select_related("restaurant")
 
     def perform_update(self, serializer):
-        serializer.save(cancell_datetime=timezone.now())
+        transition_order(serializer.instance, Order.CANCELLED)
 
 
-class CustomerAprroveDeliveredOrder(generics.UpdateAPIView):
+class CustomerAprroveDeliveredOrder(CachedObjectMixin, generics.UpdateAPIView):
     """
     Aprrove that order has been delivered.
     """
@@ -227,10 +442,10 @@ class CustomerAprroveDeliveredOrder(generics.UpdateAPIView):
         IsCustomerOfOrder,
         CustomerApproveDeliveredOrderPermission,
     )
-    queryset = Order.objects.all()
+    queryset = Order.objects.select_related("restaurant")
 
     def perform_update(self, serializer):
-        serializer.save(delivered_datetime=timezone.now())
+        transition_order(serializer.instance, Order.DELIVERED)
 
 
 class ManagerActiveOrderList(generics.ListAPIView):
@@ -239,6 +454,7 @@ class ManagerActiveOrderList(generics.ListAPIView):
     """
 
     serializer_class = PlaceOrderSerializer
+    pagination_class = OrderCursorPagination
     permission_classes = (
         IsAuthenticated,
         ManagerPermission,
@@ -246,20 +462,20 @@ class ManagerActiveOrderList(generics.ListAPIView):
     )
 
     def get_queryset(self):
-        restaurant = Restaurant.objects.filter(manager=self.request.user.pk).first()
-        foods = Food.objects.filter(restaurant=restaurant.pk).values_list("id").first()
-        orders = Order.objects.filter(
-            foods__in=foods, is_cancelled=False, is_delivered=False
-        )
-        return orders
+        return Order.objects.filter(
+            restaurant__manager=self.request.user.pk,
+            status__in=Order.ACTIVE_STATUSES,
+        ).prefetch_related("items")
 
 
-class ManagerCancelledOrderList(generics.ListAPIView):
+class ManagerOverdueOrderList(generics.ListAPIView):
     """
-    List of manager's restaurant cancelled orders.
+    List of manager's restaurant accepted orders past their delivery
+    deadline, the most overdue first.
     """
 
     serializer_class = PlaceOrderSerializer
+    pagination_class = DueCursorPagination
     permission_classes = (
         IsAuthenticated,
         ManagerPermission,
@@ -267,20 +483,20 @@ class ManagerCancelledOrderList(generics.ListAPIView):
     )
 
     def get_queryset(self):
-        restaurant = Restaurant.objects.filter(manager=self.request.user.pk).first()
-        foods = Food.objects.filter(restaurant=restaurant.pk).values_list("id").first()
-        orders = Order.objects.filter(
-            foods__in=foods, is_cancelled=True
-        )
-        return orders
+        return Order.objects.filter(
+            restaurant__manager=self.request.user.pk,
+            status=Order.ACCEPTED,
+            due_datetime__lt=timezone.now(),
+        ).prefetch_related("items")
 
 
-class ManagerDeliveredOrderList(generics.ListAPIView):
+class ManagerCancelledOrderList(ReplicaReadMixin, generics.ListAPIView):
     """
-    List of manager's restaurant delivered orders.
+    List of manager's restaurant cancelled orders, archived ones included.
     """
 
     serializer_class = PlaceOrderSerializer
+    pagination_class = OrderCursorPagination
     permission_classes = (
         IsAuthenticated,
         ManagerPermission,
@@ -288,15 +504,140 @@ class ManagerDeliveredOrderList(generics.ListAPIView):
     )
 
     def get_queryset(self):
-        restaurant = Restaurant.objects.filter(manager=self.request.user.pk).first()
-        foods = Food.objects.filter(restaurant=restaurant.pk).values_list("id").first()
-        orders = Order.objects.filter(
-            foods__in=foods, is_delivered=True
+        return OrderHistory.filter_orders(
+            restaurant__manager=self.request.user.pk, status=Order.CANCELLED
+        ).prefetch_related("items")
+
+
+class ManagerDeliveredOrderList(ReplicaReadMixin, generics.ListAPIView):
+    """
+    List of manager's restaurant delivered orders, archived ones included.
+    """
+
+    serializer_class = PlaceOrderSerializer
+    pagination_class = OrderCursorPagination
+    permission_classes = (
+        IsAuthenticated,
+        ManagerPermission,
+        HasRestaurant,
+    )
+
+    def get_queryset(self):
+        return OrderHistory.filter_orders(
+            restaurant__manager=self.request.user.pk, status=Order.DELIVERED
+        ).prefetch_related("items")
+
+
+class ManagerStats(generics.ListAPIView):
+    """
+    Daily order counts, revenue, cancellation rate and accept to deliver
+    time of the manager's restaurant between start and end.
+    """
+
+    serializer_class = RestaurantDailyStatsSerializer
+    pagination_class = None
+    permission_classes = (
+        IsAuthenticated,
+        ManagerPermission,
+        HasRestaurant,
+    )
+
+    def get_queryset(self):
+        return RestaurantDailyStats.objects.filter(
+            restaurant__manager=self.request.user.pk
+        ).order_by("day")
+
+    def list(self, request, *args, **kwargs):
+        period = StatsRangeSerializer(data=request.query_params.dict())
+        period.is_valid(raise_exception=True)
+        start, end = period.validated_data["start"], period.validated_data["end"]
+        rollups = list(self.get_queryset().filter(day__range=(start, end)))
+        totals = RestaurantDailyStats(
+            day=None,
+            **{
+                name: sum(getattr(rollup, name) for rollup in rollups)
+                for name in STATS_SUM_FIELDS
+            }
+        )
+        serializer = self.get_serializer(rollups, many=True)
+        totals = self.get_serializer(totals).data
+        del totals["day"]
+        return Response(
+            {"start": start, "end": end, "days": serializer.data, "totals": totals}
+        )
+
+
+class OrderExport(generics.GenericAPIView):
+    """
+    Stream the orders of every restaurant placed between start and end as
+    CSV or NDJSON, chosen by the format parameter or the Accept header.
+    """
+
+    renderer_classes = (CSVRenderer, NDJSONRenderer)
+    permission_classes = (
+        IsAuthenticated,
+        IsAdminUser,
+    )
+
+    def get_queryset(self):
+        return OrderHistory.filter_orders()
+
+    def get(self, request, *args, **kwargs):
+        filters = ExportFilterSerializer(data=request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        # The rows are read after the view returns, so the database is
+        # chosen now.
+        with read_from_replicas(request.user):
+            database = router.db_for_read(Order)
+        rows = export_rows(filters.filter(self.get_queryset()).using(database))
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(EXPORT_FIELDS, rows),
+            content_type="{}; charset={}".format(renderer.media_type, renderer.charset),
         )
-        return orders
+        response["Content-Disposition"] = 'attachment; filename="orders.{}"'.format(
+            renderer.format
+        )
+        return response
+
+
+class ManagerOrderExport(OrderExport):
+    """
+    Stream the orders of the manager's restaurant placed between start and
+    end as CSV or NDJSON.
+    """
+
+    permission_classes = (
+        IsAuthenticated,
+        ManagerPermission,
+        HasRestaurant,
+    )
+
+    def get_queryset(self):
+        return OrderHistory.filter_orders(restaurant__manager=self.request.user.pk)
+
+
+class ManagerAcceptOrderBulk(generics.GenericAPIView):
+    """
+    Accept a list of orders and get the result of each one.
+    """
+
+    serializer_class = BulkAcceptOrderSerializer
+    permission_classes = (
+        IsAuthenticated,
+        ManagerPermission,
+        HasRestaurant,
+    )
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        fields = dict(serializer.validated_data)
+        results = accept_orders(request.user, fields.pop("orders"), **fields)
+        return Response({"results": results}, status=status.HTTP_200_OK)
 
 
-class ManagerCancellOrder(generics.UpdateAPIView):
+class ManagerCancellOrder(CachedObjectMixin, generics.UpdateAPIView):
     """
     Cancell order if has permission to.
     """
@@ -307,13 +648,13 @@ class ManagerCancellOrder(generics.UpdateAPIView):
         IsManagerOfOrder,
         ManagerCancellAcceptOrderPermission,
     )
-    queryset = Order.objects.all()
+    queryset = Order.objects.select_related("restaurant")
 
     def perform_update(self, serializer):
-        serializer.save(cancell_datetime=timezone.now())
+        transition_order(serializer.instance, Order.CANCELLED)
 
 
-class ManagerAcceptOrder(generics.UpdateAPIView):
+class ManagerAcceptOrder(CachedObjectMixin, generics.UpdateAPIView):
     """
     Accept order if has permission to.
     """
@@ -324,7 +665,9 @@ class ManagerAcceptOrder(generics.UpdateAPIView):
         IsManagerOfOrder,
         ManagerCancellAcceptOrderPermission,
     )
-    queryset = Order.objects.all()
+    queryset = Order.objects.select_related("restaurant")
 
     def perform_update(self, serializer):
-        serializer.save(accept_datetime=timezone.now())
+        fields = dict(serializer.validated_data)
+        fields.pop("is_accepted", None)
+        transition_order(serializer.instance, Order.ACCEPTED, **fields)